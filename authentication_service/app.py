@@ -7,6 +7,9 @@ import time
 import logging
 import json
 import uuid
+import hashlib
+import threading
+import pika
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 
@@ -47,6 +50,34 @@ DB_CONFIG = {
     'password': os.environ.get('DB_PASSWORD', 'password'),
 }
 
+# RabbitMQ: eventos de sessão (logout) para as caches de tokens dos outros serviços
+QUEUE_HOST = os.environ.get('QUEUE_HOST', 'queue_service')
+QUEUE_USER = os.environ.get('QUEUE_USER', 'ualflix')
+QUEUE_PASSWORD = os.environ.get('QUEUE_PASSWORD', 'ualflix_password')
+AUTH_EVENTS_EXCHANGE = 'auth_events'
+
+def _publish_auth_event(event):
+    try:
+        credentials = pika.PlainCredentials(QUEUE_USER, QUEUE_PASSWORD)
+        parameters = pika.ConnectionParameters(
+            host=QUEUE_HOST,
+            credentials=credentials,
+            socket_timeout=5,
+            blocked_connection_timeout=5
+        )
+        connection = pika.BlockingConnection(parameters)
+        channel = connection.channel()
+        channel.exchange_declare(exchange=AUTH_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+        channel.basic_publish(exchange=AUTH_EVENTS_EXCHANGE, routing_key='', body=json.dumps(event))
+        connection.close()
+    except Exception as e:
+        # Best-effort: as caches expiram sozinhas (TTL curto)
+        logger.warning(f"Erro ao publicar evento de autenticação: {e}")
+
+def publish_auth_event(event):
+    """Publica um evento de sessão em background (não atrasa a resposta)."""
+    threading.Thread(target=_publish_auth_event, args=(event,), daemon=True).start()
+
 def get_db_connection():
     """Obter conexão simples com a base de dados"""
     try:
@@ -59,13 +90,18 @@ def get_db_connection():
 def generate_session_token():
     return str(uuid.uuid4())
 
-def get_user_from_token(token):
-    """Retorna informações do usuário baseado no token de sessão."""
+def get_session(token):
+    """Sessão ativa e não expirada do token (None se não existir)."""
     session_data = active_sessions.get(token)
     if session_data and session_data['expires'] > datetime.now():
-        return session_data['user']
+        return session_data
     return None
 
+def get_user_from_token(token):
+    """Retorna informações do usuário baseado no token de sessão."""
+    session_data = get_session(token)
+    return session_data['user'] if session_data else None
+
 @app.route("/register", methods=["POST"])
 def register():
     try:
@@ -200,11 +236,15 @@ def validate_session():
         if not token:
             return jsonify({"success": False, "error": "Token required"}), 400
         
-        user = get_user_from_token(token)
-        if user:
+        # A sessão lida uma só vez (um logout concorrente pode removê-la)
+        session_data = get_session(token)
+        if session_data:
+            # expires_in permite a quem valida guardar o resultado em cache
+            expires_in = (session_data['expires'] - datetime.now()).total_seconds()
             return jsonify({
                 "success": True,
-                "user": user
+                "user": session_data['user'],
+                "expires_in": max(int(expires_in), 0)
             }), 200
         else:
             return jsonify({"success": False, "error": "Invalid or expired token"}), 401
@@ -222,6 +262,11 @@ def logout():
         
         if token and token in active_sessions:
             del active_sessions[token]
+            # Invalida o token nas caches locais dos outros serviços
+            publish_auth_event({
+                "event": "logout",
+                "token_hash": hashlib.sha256(token.encode('utf-8')).hexdigest()
+            })
         
         return jsonify({"success": True, "message": "Logged out successfully"}), 200
         
@@ -1,12 +1,28 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-from db import get_db_connection
+from werkzeug.exceptions import HTTPException, BadRequest
+from db import (db_connection, get_replica_read_connection, return_db_connection,
+                current_wal_lsn, detach, release_thread_connections, execute_read_query)
+from upload_stream import parse_streaming_upload, StreamedFile
+from resumable import ResumableUploads, parse_checksum_header
+from publisher import ConfirmedPublisher
+from outbox import OutboxRelay, enqueue_outbox
+from token_cache import TokenCache, TokenInvalidationListener
+from catalog_cache import (CatalogCache, CatalogEventsListener, CATALOG_EVENTS_EXCHANGE,
+                           CATALOG_CACHE_MAX_AGE, catalog_event, make_document)
+from suggest_index import SuggestIndex
+from prometheus_client import Histogram
 from prometheus_flask_exporter import PrometheusMetrics
 import os
+import re
 import time
 import logging
+import threading
 import json
+import uuid
+import base64
 import pika
+from datetime import datetime
 import requests
 
 
@@ -22,10 +38,21 @@ app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # 1GB
 # Configurar métricas Prometheus
 metrics = PrometheusMetrics(app)
 
+@app.teardown_request
+def release_request_connections(exc):
+    """Garante que nenhuma conexão do pool sobrevive ao pedido (fugas contadas)."""
+    release_thread_connections()
+
 # Configuração do ambiente
 VIDEO_FOLDER = '/videos'
 os.makedirs(VIDEO_FOLDER, exist_ok=True)
 
+# Uploads são guardados por conteúdo: <sha256><ext>, um blob por conteúdo
+
+# Uploads resumíveis em curso (pasta oculta no mesmo sistema de ficheiros)
+RESUMABLE_FOLDER = os.path.join(VIDEO_FOLDER, '.uploads')
+resumable_uploads = ResumableUploads(RESUMABLE_FOLDER)
+
 # Configuração RabbitMQ
 QUEUE_HOST = os.environ.get('QUEUE_HOST', 'queue_service')
 QUEUE_USER = os.environ.get('QUEUE_USER', 'ualflix')
@@ -34,65 +61,501 @@ QUEUE_PASSWORD = os.environ.get('QUEUE_PASSWORD', 'ualflix_password')
 # URL do serviço de autenticação
 AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://authentication_service:8000')
 
-def get_rabbitmq_connection():
-    """Conecta ao RabbitMQ."""
-    try:
-        credentials = pika.PlainCredentials(QUEUE_USER, QUEUE_PASSWORD)
-        parameters = pika.ConnectionParameters(
-            host=QUEUE_HOST,
-            credentials=credentials,
-            heartbeat=600,
-            blocked_connection_timeout=300
-        )
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        
-        # Declarar a fila
-        channel.queue_declare(queue='video_processing', durable=True)
-        
-        return connection, channel
-    except Exception as e:
-        logger.error(f"Erro ao conectar ao RabbitMQ: {e}")
-        return None, None
+def rabbitmq_parameters():
+    """Parâmetros de ligação ao RabbitMQ."""
+    credentials = pika.PlainCredentials(QUEUE_USER, QUEUE_PASSWORD)
+    return pika.ConnectionParameters(
+        host=QUEUE_HOST,
+        credentials=credentials,
+        heartbeat=600,
+        blocked_connection_timeout=300
+    )
 
-def send_to_processing_queue(video_data):
-    """Envia dados do vídeo para a fila de processamento."""
-    try:
-        connection, channel = get_rabbitmq_connection()
-        if channel:
-            message = json.dumps(video_data)
-            channel.basic_publish(
-                exchange='',
-                routing_key='video_processing',
-                body=message,
-                properties=pika.BasicProperties(delivery_mode=2)  # Torna a mensagem persistente
-            )
-            connection.close()
-            logger.info(f"Vídeo enviado para processamento: {video_data['filename']}")
-            return True
-    except Exception as e:
-        logger.error(f"Erro ao enviar para fila de processamento: {e}")
-    return False
+# Ligação persistente por processo, usada pelo relay da outbox
+queue_publisher = ConfirmedPublisher(
+    rabbitmq_parameters(), queues=['video_processing'], exchanges=[CATALOG_EVENTS_EXCHANGE]
+).start()
+
+# O upload grava a mensagem na outbox (mesma transação do vídeo); o relay publica-a
+outbox_relay = OutboxRelay(queue_publisher).start()
+
+# Cache local de tokens (invalidada pelos eventos de logout do auth service)
+token_cache = TokenCache()
+TokenInvalidationListener(token_cache, rabbitmq_parameters()).start()
+
+# Índice de sugestões em memória (construído a partir da réplica em background)
+suggest_index = SuggestIndex().start()
+
+# Cache das listagens e vídeos serializados (invalidada pelos eventos catalog_events)
+catalog_cache = CatalogCache()
+CatalogEventsListener(
+    catalog_cache, rabbitmq_parameters(), subscribers=[suggest_index.on_catalog_event]
+).start()
+
+# Sessão HTTP com keep-alive para os misses da cache
+AUTH_POOL_SIZE = int(os.environ.get('AUTH_POOL_SIZE', '20'))
+auth_session = requests.Session()
+auth_session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=AUTH_POOL_SIZE))
+
+AUTH_VALIDATE_TIME = Histogram(
+    'catalog_auth_validate_seconds', 'Token validation requests to the authentication service',
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
 
 def validate_user_token(token):
-    """Valida token do usuário com o serviço de autenticação."""
+    """Valida token do usuário (cache local; serviço de autenticação nos misses)."""
+    found, user = token_cache.lookup(token)
+    if found:
+        return user
+    
     try:
-        response = requests.post(
-            f"{AUTH_SERVICE_URL}/validate",
-            json={"token": token},
-            timeout=5
-        )
+        with AUTH_VALIDATE_TIME.time():
+            response = auth_session.post(
+                f"{AUTH_SERVICE_URL}/validate",
+                json={"token": token},
+                timeout=5
+            )
         if response.status_code == 200:
-            return response.json().get('user')
+            data = response.json()
+            user = data.get('user')
+            token_cache.store(token, user, data.get('expires_in'))
+            return user
+        if response.status_code == 401:
+            token_cache.store(token, None)
+            return None
+        logger.error(f"Erro ao validar token: HTTP {response.status_code}")
     except Exception as e:
         logger.error(f"Erro ao validar token: {e}")
     return None
 
+def blob_extension(original_filename):
+    """Extensão (normalizada) a usar no blob, a partir do nome original."""
+    ext = os.path.splitext(original_filename or '')[1].lower()
+    return ext if re.match(r'^\.[a-z0-9]{1,8}$', ext) else '.mp4'
+
+def find_blob_by_hash(content_hash, ext):
+    """Nome do blob já existente com este conteúdo, se houver."""
+    candidate = content_hash + ext
+    if os.path.exists(os.path.join(VIDEO_FOLDER, candidate)):
+        return candidate
+    
+    # O mesmo conteúdo pode ter sido enviado antes com outra extensão
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT filename FROM videos WHERE content_hash = %s LIMIT 1", (content_hash,))
+        row = cur.fetchone()
+        cur.close()
+    if row and os.path.exists(os.path.join(VIDEO_FOLDER, row[0])):
+        return row[0]
+    return None
+
+def resolve_upload_blob(upload):
+    """
+    Blob do upload (já escrito e com SHA-256 calculado): <sha256><ext> ou o
+    blob existente com o mesmo conteúdo.
+    
+    Returns:
+        (filename, deduplicated)
+    """
+    ext = blob_extension(upload.filename)
+    existing = find_blob_by_hash(upload.sha256, ext)
+    if existing:
+        return existing, True
+    return upload.sha256 + ext, False
+
+def place_upload_blob(upload, filename, deduplicated):
+    """
+    O conteúdo está num ficheiro temporário na própria pasta de vídeos e é
+    movido atomicamente para o blob; se o blob já existir, o temporário é
+    descartado e o blob existente reutilizado.
+    """
+    if deduplicated:
+        os.remove(upload.tmp_path)
+    else:
+        os.replace(upload.tmp_path, os.path.join(VIDEO_FOLDER, filename))
+
+def register_video(user, title, description, upload, discard_on_error=True):
+    """
+    Regista um upload completo no catálogo e envia-o para processamento
+    (via outbox: vídeo e mensagem no mesmo commit).
+    
+    Usado pelo /upload (multipart) e pelo finalize dos uploads resumíveis.
+    Em caso de erro o temporário do multipart é apagado; o .part de um
+    upload resumível (discard_on_error=False) fica, para repetir o finalize.
+    """
+    content_hash = upload.sha256
+    try:
+        safe_filename, deduplicated = resolve_upload_blob(upload)
+        filepath = os.path.join(VIDEO_FOLDER, safe_filename)
+
+        # Gerar a URL (caminho para acessar o vídeo depois)
+        url = f"/stream/{safe_filename}"
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO videos (title, description, filename, url, user_id, status, content_hash) VALUES (%s, %s, %s, %s, %s, 'processing', %s) RETURNING id",
+                (title, description, safe_filename, url, user['id'], content_hash)
+            )
+            video_id = cur.fetchone()[0]
+
+            # Mensagem para a fila de processamento, no mesmo commit do vídeo (resultados em cache por hash)
+            video_data = {
+                'id': video_id,
+                'filename': safe_filename,
+                'title': title,
+                'user_id': user['id'],
+                'filepath': filepath,
+                'content_hash': content_hash
+            }
+            enqueue_outbox(cur, video_id, 'video_processing', video_data)
+            conn.commit()
+            cur.close()
+
+            # Só depois do commit: uma transação falhada não deixa blobs órfãos
+            place_upload_blob(upload, safe_filename, deduplicated)
+
+            # Token de read-your-writes: leituras com este LSN só vão a réplicas que já o aplicaram
+            lsn = current_wal_lsn(conn)
+    except Exception:
+        if discard_on_error and os.path.exists(upload.tmp_path):
+            os.remove(upload.tmp_path)
+        raise
+    if deduplicated:
+        logger.info(f"Conteúdo já existente, blob reutilizado: {safe_filename}")
+    outbox_relay.wake()
+    # Listagens em cache (desta e das outras instâncias) deixam de servir
+    catalog_cache.invalidate([video_id], lsn, source='local')
+    suggest_index.add(video_id, title)
+    queue_publisher.publish(
+        '', catalog_event([video_id], lsn, 'video_uploaded', videos=[{"id": video_id, "title": title}]),
+        exchange=CATALOG_EVENTS_EXCHANGE
+    )
+    logger.info(f"Vídeo registado para processamento: {safe_filename}")
+
+    return {
+        "message": "Video uploaded successfully!",
+        "filename": safe_filename,
+        "url": url,
+        "video_id": video_id,
+        "content_hash": content_hash,
+        "deduplicated": deduplicated,
+        "lsn": lsn
+    }
+
+def video_to_dict(video):
+    """Serializa uma linha de vídeo (id, title, ..., duration, thumbnail_path, status)."""
+    return {
+        'id': video[0],
+        'title': video[1],
+        'description': video[2],
+        'filename': video[3],
+        'url': video[4],
+        'upload_date': video[5].isoformat() if video[5] else None,
+        'uploaded_by': video[6] or 'Unknown',
+        'duration': video[7],
+        'thumbnail_url': f"/stream/{os.path.basename(video[8])}" if video[8] else None,
+        'status': video[9]
+    }
+
+# Colunas lidas por video_to_dict
+VIDEO_COLUMNS = """
+    v.id, v.title, v.description, v.filename, v.url, v.upload_date, u.username,
+    v.duration, v.thumbnail_path, v.status
+"""
+
+VIDEO_SELECT = f"""
+    SELECT {VIDEO_COLUMNS}
+    FROM videos v
+    LEFT JOIN users u ON v.user_id = u.id
+"""
+
+# Paginação por keyset em (upload_date, id)
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Linhas trazidas por ida ao servidor na listagem completa (cursor no servidor)
+STREAM_FETCH_SIZE = 500
+
+def encode_position(value, video_id):
+    """Cursor opaco com a posição (valor de ordenação, id) do último vídeo da página."""
+    raw = f"{value}|{video_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_position(cursor, parse_value):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, video_id = raw.rsplit('|', 1)
+        return parse_value(value), int(video_id)
+    except ValueError:
+        raise BadRequest("Cursor 'after' inválido")
+
+def encode_cursor(video):
+    return encode_position(video[5].isoformat(), video[0])
+
+def decode_cursor(cursor):
+    return decode_position(cursor, datetime.fromisoformat)
+
+def read_min_lsn():
+    """LSN devolvido pelo /upload (X-Min-LSN ou ?min_lsn=) para read-your-writes."""
+    lsn = request.headers.get('X-Min-LSN') or request.args.get('min_lsn')
+    if lsn and not re.match(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$', lsn):
+        raise BadRequest("LSN inválido")
+    return lsn
+
+def fetch_videos_page(user_id, limit, after, min_lsn=None):
+    """
+    Uma página de vídeos, do mais recente para o mais antigo.
+    
+    Usa o índice (upload_date DESC, id DESC): o custo não depende da
+    profundidade da página, ao contrário de OFFSET.
+    
+    Returns:
+        (videos, next_cursor)
+    """
+    conditions = []
+    params = []
+    if user_id is not None:
+        conditions.append("v.user_id = %s")
+        params.append(user_id)
+    if after:
+        conditions.append("(v.upload_date, v.id) < (%s, %s)")
+        params.extend(decode_cursor(after))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    
+    # Pedidos iguais em simultâneo (ex.: primeira página) partilham uma só query
+    rows = execute_read_query(
+        f"{VIDEO_SELECT} {where} ORDER BY v.upload_date DESC, v.id DESC LIMIT %s",
+        params + [limit + 1], min_lsn=min_lsn
+    )
+    
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [video_to_dict(row) for row in rows[:limit]], next_cursor
+
+def stream_all_videos(user_id, min_lsn=None, on_complete=None):
+    """
+    Listagem completa (formato antigo: array JSON) em streaming.
+    
+    As linhas vêm de um cursor no servidor em blocos de STREAM_FETCH_SIZE e
+    são serializadas à medida, por isso a memória não cresce com o catálogo.
+    on_complete(body) recebe o corpo inteiro para a cache, se couber no
+    limite de um documento.
+    """
+    if request.method == 'HEAD':
+        # Sem corpo: não vale a pena abrir um cursor (nem ocupar uma conexão)
+        return Response(mimetype='application/json')
+    
+    conn = get_replica_read_connection(min_lsn)
+    try:
+        cur = conn.cursor(name=f"videos_{uuid.uuid4().hex}")
+        cur.itersize = STREAM_FETCH_SIZE
+        if user_id is not None:
+            cur.execute(f"{VIDEO_SELECT} WHERE v.user_id = %s ORDER BY v.upload_date DESC, v.id DESC", (user_id,))
+        else:
+            cur.execute(f"{VIDEO_SELECT} ORDER BY v.upload_date DESC, v.id DESC")
+    except Exception:
+        conn.rollback()
+        return_db_connection(conn)
+        raise
+    # O gerador corre depois do teardown do pedido; a conexão é devolvida
+    # quando a resposta é fechada (mesmo se o gerador nunca chegar a correr:
+    # HEAD ou cliente que desliga antes do primeiro bloco)
+    detach(conn)
+    released = threading.Lock()
+    
+    def release():
+        if not released.acquire(blocking=False):
+            return
+        try:
+            cur.close()
+            conn.rollback()
+        except Exception as e:
+            logger.error(f"Erro ao fechar o cursor da listagem: {e}")
+        finally:
+            return_db_connection(conn)
+    
+    def generate():
+        captured = [] if on_complete else None
+        captured_size = 0
+        try:
+            yield '['
+            for index, row in enumerate(cur):
+                chunk = (',' if index else '') + app.json.dumps(video_to_dict(row))
+                if captured is not None:
+                    captured.append(chunk)
+                    captured_size += len(chunk)
+                    if captured_size > catalog_cache.max_entry_bytes:
+                        captured = None
+                yield chunk
+            yield ']'
+            if captured is not None:
+                on_complete(('[' + ''.join(captured) + ']').encode())
+        except Exception as e:
+            # O status já foi enviado: só resta terminar a resposta
+            logger.error(f"Erro durante o streaming da listagem: {e}")
+        finally:
+            release()
+    
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    response.call_on_close(release)
+    return response
+
+# Pesquisa full-text (coluna search_vector, índice GIN)
+# O último termo é um prefixo (type-ahead) se tiver pelo menos SEARCH_MIN_PREFIX caracteres
+SEARCH_MIN_PREFIX = 2
+SEARCH_MAX_TERMS = 8
+
+# Só os SEARCH_MAX_CANDIDATES resultados mais recentes são ordenados por relevância:
+# termos muito comuns (ou prefixos curtos) têm centenas de milhares de matches e
+# calcular o rank de todos custa centenas de ms (ver load_testing/search_benchmark.py)
+SEARCH_MAX_CANDIDATES = int(os.environ.get('SEARCH_MAX_CANDIDATES', '5000'))
+
+# float8: o valor volta no cursor e tem de comparar igual ao calculado na query
+SEARCH_RANK = "ts_rank_cd(c.search_vector, query)::float8"
+
+def build_tsquery(text):
+    """
+    'gato pre' -> 'gato & pre:*' para to_tsquery('simple', ...).
+    
+    Só passam letras e dígitos (o utilizador não consegue injetar operadores);
+    um espaço no fim indica que a última palavra está completa.
+    """
+    terms = re.findall(r'[^\W_]+', text.lower())[:SEARCH_MAX_TERMS]
+    if not terms:
+        return None
+    if not text[-1].isspace() and len(terms[-1]) >= SEARCH_MIN_PREFIX:
+        terms[-1] += ':*'
+    return ' & '.join(terms)
+
+def search_videos(tsquery, limit, after, min_lsn=None):
+    """
+    Uma página de resultados por relevância (ts_rank_cd; título pesa mais
+    do que a descrição) entre os SEARCH_MAX_CANDIDATES matches mais
+    recentes, com cursor (rank, id).
+    
+    Returns:
+        (videos, next_cursor)
+    """
+    params = [tsquery, SEARCH_MAX_CANDIDATES, tsquery]
+    cursor_condition = ""
+    if after:
+        cursor_condition = f"WHERE ({SEARCH_RANK}, v.id) < (%s, %s)"
+        params.extend(decode_position(after, float))
+    
+    rows = execute_read_query(f"""
+        WITH candidates AS MATERIALIZED (
+            SELECT id, search_vector
+            FROM videos
+            WHERE search_vector @@ to_tsquery('simple', %s)
+            ORDER BY id DESC
+            LIMIT %s
+        )
+        SELECT {VIDEO_COLUMNS}, {SEARCH_RANK} AS rank
+        FROM candidates c
+        CROSS JOIN to_tsquery('simple', %s) AS query
+        JOIN videos v ON v.id = c.id
+        LEFT JOIN users u ON v.user_id = u.id
+        {cursor_condition}
+        ORDER BY rank DESC, v.id DESC
+        LIMIT %s
+    """, params + [limit + 1], min_lsn=min_lsn)
+    
+    next_cursor = encode_position(repr(rows[limit - 1][10]), rows[limit - 1][0]) if len(rows) > limit else None
+    return [video_to_dict(row) for row in rows[:limit]], next_cursor
+
+def read_limit():
+    """?limit= limitado a [1, MAX_PAGE_SIZE]."""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("Parâmetro 'limit' inválido")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def document_response(document, private=False):
+    """Resposta de um documento serializado com ETag (304 se o cliente já o tem)."""
+    response = Response(document.body, mimetype='application/json')
+    response.set_etag(document.etag)
+    response.headers['Cache-Control'] = (
+        f"{'private' if private else 'public'}, max-age={CATALOG_CACHE_MAX_AGE}, must-revalidate"
+    )
+    if private:
+        response.vary.add('X-Session-Token')
+    return response.make_conditional(request)
+
+# Multi-get: máximo de ids por pedido (GET /videos?ids= ou POST /videos)
+MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '1000'))
+
+def parse_video_ids(values):
+    """Ids únicos, pela ordem pedida; BadRequest se inválidos ou demasiados."""
+    try:
+        ids = [int(value) for value in values]
+    except (TypeError, ValueError):
+        raise BadRequest("Parâmetro 'ids' inválido")
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise BadRequest("Parâmetro 'ids' obrigatório")
+    if len(ids) > MULTI_GET_MAX_IDS:
+        raise BadRequest(f"Máximo de {MULTI_GET_MAX_IDS} ids por pedido")
+    return ids
+
+def multi_get_response(video_ids):
+    """
+    Vários vídeos numa só query (WHERE id = ANY), partilhando as entradas
+    ('video', id) da cache com GET /videos/<id>.
+
+    O corpo junta os documentos já serializados, pela ordem pedida, e
+    indica os ids que não existem em "missing".
+    """
+    def build_many(keys, lsn):
+        rows = execute_read_query(
+            f"{VIDEO_SELECT} WHERE v.id = ANY(%s)", ([key[1] for key in keys],), min_lsn=lsn
+        )
+        return {('video', row[0]): app.json.dumps(video_to_dict(row)).encode() for row in rows}
+
+    documents = catalog_cache.fetch_many([('video', video_id) for video_id in video_ids], read_min_lsn(), build_many)
+    found = [documents[('video', video_id)].body for video_id in video_ids if ('video', video_id) in documents]
+    missing = [video_id for video_id in video_ids if ('video', video_id) not in documents]
+    body = b'{"videos":[' + b','.join(found) + b'],"missing":' + app.json.dumps(missing).encode() + b'}'
+    return document_response(make_document(body))
+
+def videos_response(user_id):
+    """Página (?limit=&after=) ou listagem completa, servidas da cache quando possível."""
+    min_lsn = read_min_lsn()
+    private = user_id is not None
+    if 'limit' not in request.args and 'after' not in request.args:
+        key = ('list', user_id, 'all')
+        if not catalog_cache.usable_for(min_lsn):
+            return stream_all_videos(user_id, min_lsn)
+        document = catalog_cache.get(key)
+        if document is not None:
+            return document_response(document, private)
+        # Miss: a resposta segue em streaming e o corpo completo fica em cache
+        version, fill_lsn = catalog_cache.begin_fill(min_lsn)
+        return stream_all_videos(
+            user_id, fill_lsn, on_complete=lambda body: catalog_cache.store(key, body, version)
+        )
+    
+    limit = read_limit()
+    after = request.args.get('after')
+    
+    def build(lsn):
+        videos, next_cursor = fetch_videos_page(user_id, limit, after, lsn)
+        return app.json.dumps({
+            "videos": videos,
+            "limit": limit,
+            "next_cursor": next_cursor
+        }).encode()
+    
+    document = catalog_cache.fetch(('list', user_id, limit, after), min_lsn, build)
+    return document_response(document, private)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     try:
-        conn = get_db_connection()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
         return jsonify({"status": "healthy", "db_connection": "ok"}), 200
     except Exception as e:
         logger.error(f"Erro na verificação de saúde: {e}")
@@ -114,134 +577,292 @@ def upload_video():
         if not user:
             return jsonify({"error": "Token inválido ou expirado"}), 401
 
-        title = request.form.get('title', '')
-        description = request.form.get('description', '')
-        file = request.files['file']
-
-        if file and file.filename:
-            timestamp = str(int(time.time()))
-            safe_filename = timestamp + "_" + file.filename
-            filepath = os.path.join(VIDEO_FOLDER, safe_filename)
-            file.save(filepath)
-
-            # Gerar a URL (caminho para acessar o vídeo depois)
-            url = f"/stream/{safe_filename}"
+        if request.mimetype != 'multipart/form-data':
+            return jsonify({"error": "Upload deve ser multipart/form-data"}), 400
+        
+        # Corpo lido em streaming: o ficheiro é escrito uma única vez, já na pasta final
+        form, upload = parse_streaming_upload(
+            request.stream, request.mimetype_params.get('boundary'), VIDEO_FOLDER
+        )
+        title = form.get('title', '')
+        description = form.get('description', '')
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO videos (title, description, filename, url, user_id) VALUES (%s, %s, %s, %s, %s) RETURNING id",
-                (title, description, safe_filename, url, user['id'])
-            )
-            video_id = cur.fetchone()[0]
-            conn.commit()
-            cur.close()
-            conn.close()
+        if upload and not upload.filename:
+            os.remove(upload.tmp_path)
+            upload = None
 
-            # Enviar para fila de processamento
-            video_data = {
-                'id': video_id,
-                'filename': safe_filename,
-                'title': title,
-                'user_id': user['id'],
-                'filepath': filepath
-            }
-            send_to_processing_queue(video_data)
-
-            return jsonify({
-                "message": "Video uploaded successfully!",
-                "filename": safe_filename,
-                "url": url,
-                "video_id": video_id
-            }), 200
+        if upload:
+            return jsonify(register_video(user, title, description, upload)), 200
         else:
             return jsonify({"error": "No file uploaded"}), 400
+    except HTTPException as e:
+        # Corpo multipart inválido (400) ou acima de MAX_CONTENT_LENGTH (413)
+        logger.warning(f"Upload rejeitado: {e.description}")
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
         logger.error(f"Erro no upload: {e}")
         return jsonify({"error": str(e)}), 500
 
+# ================================================================
+# UPLOADS RESUMÍVEIS (estilo tus)
+# POST /uploads -> PATCH /uploads/<id> (Upload-Offset) ... -> POST /uploads/<id>/finalize
+# ================================================================
+
+def session_user():
+    """Utilizador do X-Session-Token (None se ausente ou inválido)."""
+    token = request.headers.get('X-Session-Token')
+    return validate_user_token(token) if token else None
+
+def int_header(name):
+    value = request.headers.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise BadRequest(f"Cabeçalho {name} inválido")
+
+def upload_state_response(meta, status=200):
+    """Estado de um upload resumível em JSON + cabeçalhos Upload-*."""
+    response = jsonify({
+        "upload_id": meta['id'],
+        "offset": meta.get('offset', 0),
+        "length": meta['length'],
+        "received": meta.get('received', 0),
+        "missing": meta['length'] - meta.get('received', 0),
+        "filename": meta['filename']
+    })
+    response.status_code = status
+    response.headers['Upload-Offset'] = str(meta.get('offset', 0))
+    response.headers['Upload-Length'] = str(meta['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/uploads', methods=['POST'])
+def create_resumable_upload():
+    """Cria um upload resumível: JSON {filename, length, title, description} ou Upload-Length."""
+    try:
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Token inválido ou expirado"}), 401
+
+        data = request.get_json(silent=True) or {}
+        length = data.get('length')
+        if length is None:
+            length = int_header('Upload-Length')
+        if not isinstance(length, int) or not data.get('filename'):
+            return jsonify({"error": "filename e length são obrigatórios"}), 400
+        if length > app.config['MAX_CONTENT_LENGTH']:
+            return jsonify({"error": "Ficheiro excede o tamanho máximo"}), 413
+
+        meta = resumable_uploads.create(
+            user['id'], length, data['filename'],
+            data.get('title', ''), data.get('description', '')
+        )
+        response = upload_state_response(meta, 201)
+        response.headers['Location'] = f"/api/uploads/{meta['id']}"
+        return response
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao criar upload resumível: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def get_resumable_upload(upload_id):
+    """Offset atual (bytes contíguos recebidos desde 0) para retomar o upload."""
+    try:
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Token inválido ou expirado"}), 401
+        return upload_state_response(resumable_uploads.get(upload_id, user['id']))
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao consultar upload {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def patch_resumable_upload(upload_id):
+    """Recebe um chunk (corpo binário) na posição Upload-Offset."""
+    try:
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Token inválido ou expirado"}), 401
+
+        checksum_header = request.headers.get('Upload-Checksum')
+        checksum = parse_checksum_header(checksum_header) if checksum_header else None
+        meta = resumable_uploads.write_chunk(
+            upload_id, user['id'], int_header('Upload-Offset'),
+            request.stream, request.content_length, checksum
+        )
+        response = upload_state_response(meta)
+        response.status_code = 204
+        response.set_data(b'')
+        return response
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao receber chunk do upload {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_resumable_upload(upload_id):
+    """Upload completo: regista o vídeo e só agora o envia para processamento."""
+    try:
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Token inválido ou expirado"}), 401
+
+        expected_hash = (request.get_json(silent=True) or {}).get('sha256')
+        with resumable_uploads.locked(upload_id):
+            meta, content_hash = resumable_uploads.complete(upload_id, user['id'])
+            if expected_hash and expected_hash.lower() != content_hash:
+                return jsonify({"error": "SHA-256 do ficheiro não confere", "sha256": content_hash}), 422
+
+            upload = StreamedFile('file', meta['filename'], resumable_uploads.data_path(upload_id),
+                                  meta['length'], content_hash)
+            result = register_video(user, meta['title'], meta['description'], upload,
+                                    discard_on_error=False)
+            resumable_uploads.finish(upload_id)
+        return jsonify(result), 200
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao finalizar upload {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_resumable_upload(upload_id):
+    """Cancela um upload resumível e liberta o espaço reservado."""
+    try:
+        user = session_user()
+        if not user:
+            return jsonify({"error": "Token inválido ou expirado"}), 401
+        with resumable_uploads.locked(upload_id):
+            resumable_uploads.get(upload_id, user['id'])
+            resumable_uploads.discard(upload_id)
+        return '', 204
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao cancelar upload {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/videos', methods=['GET'])
 def list_videos():
     try:
+        # GET /videos?ids=1,2,3 : vários vídeos por id
+        if 'ids' in request.args:
+            return multi_get_response(parse_video_ids(request.args['ids'].split(',')))
+
         # Opcional: filtrar por usuário se token fornecido
         token = request.headers.get('X-Session-Token')
         user_filter = request.args.get('user_only', 'false').lower() == 'true'
         
+        # Só é preciso validar o token quando se filtra por utilizador
         user = None
-        if token:
+        if token and user_filter:
             user = validate_user_token(token)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # Mostrar apenas vídeos do usuário ou todos os vídeos
+        return videos_response(user['id'] if user_filter and user else None)
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao listar vídeos: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/videos', methods=['POST'])
+def get_videos_batch():
+    """POST /videos {"ids": [...]} : como GET /videos?ids=, para conjuntos grandes."""
+    try:
+        payload = request.get_json(silent=True) or {}
+        ids = payload.get('ids')
+        if not isinstance(ids, list):
+            raise BadRequest("Corpo deve ser {\"ids\": [...]}")
+        return multi_get_response(parse_video_ids(ids))
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro ao buscar vídeos: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/search', methods=['GET'])
+def search():
+    """GET /search?q=&limit=&after= : pesquisa em títulos e descrições."""
+    try:
+        text = request.args.get('q', '')
+        if not text.strip():
+            return jsonify({"error": "Parâmetro 'q' obrigatório"}), 400
+        limit = read_limit()
+        after = request.args.get('after')
+        tsquery = build_tsquery(text)
         
-        if user_filter and user:
-            # Mostrar apenas vídeos do usuário
-            cur.execute("""
-                SELECT v.id, v.title, v.description, v.filename, v.url, v.upload_date, u.username 
-                FROM videos v 
-                LEFT JOIN users u ON v.user_id = u.id 
-                WHERE v.user_id = %s
-                ORDER BY v.upload_date DESC
-            """, (user['id'],))
-        else:
-            # Mostrar todos os vídeos
-            cur.execute("""
-                SELECT v.id, v.title, v.description, v.filename, v.url, v.upload_date, u.username 
-                FROM videos v 
-                LEFT JOIN users u ON v.user_id = u.id 
-                ORDER BY v.upload_date DESC
-            """)
+        def build(lsn):
+            videos, next_cursor = search_videos(tsquery, limit, after, lsn) if tsquery else ([], None)
+            return app.json.dumps({
+                "query": tsquery,
+                "videos": videos,
+                "limit": limit,
+                "next_cursor": next_cursor
+            }).encode()
         
-        videos = cur.fetchall()
-        cur.close()
-        conn.close()
+        # Prefixos populares (type-ahead) ficam em cache como as listagens; a chave
+        # é a tsquery normalizada ('Gato  ' e 'gato ' partilham a entrada)
+        document = catalog_cache.fetch(('list', None, 'search', tsquery, limit, after), read_min_lsn(), build)
+        return document_response(document)
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
+    except Exception as e:
+        logger.error(f"Erro na pesquisa: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        videos_list = []
-        for video in videos:
-            video_data = {
-                'id': video[0],
-                'title': video[1],
-                'description': video[2],
-                'filename': video[3],
-                'url': video[4],
-                'upload_date': video[5].isoformat() if video[5] else None,
-                'uploaded_by': video[6] or 'Unknown'
-            }
-            videos_list.append(video_data)
+# Sugestões por pedido (o índice guarda até SUGGEST_TOP_K)
+SUGGEST_DEFAULT_LIMIT = 8
+
+@app.route('/suggest', methods=['GET'])
+def suggest():
+    """GET /suggest?q=&limit= : títulos para search-as-you-type, do índice em memória."""
+    try:
+        text = request.args.get('q', '')
+        try:
+            limit = int(request.args.get('limit', SUGGEST_DEFAULT_LIMIT))
+        except ValueError:
+            raise BadRequest("Parâmetro 'limit' inválido")
+        limit = max(1, min(limit, suggest_index.top_k))
+        
+        suggestions, complete = [], True
+        if text.strip() and suggest_index.ready:
+            suggestions, complete = suggest_index.lookup(text, limit)
+        if text.strip() and (not suggest_index.ready or not complete):
+            # Índice ainda a construir (arranque) ou vários termos com a lista
+            # top-K do prefixo esgotada: pesquisa na base de dados
+            tsquery = build_tsquery(text)
+            videos, _ = search_videos(tsquery, limit, None) if tsquery else ([], None)
+            suggestions = [{"id": video['id'], "title": video['title']} for video in videos]
         
-        return jsonify(videos_list)
+        return jsonify({"query": text, "suggestions": suggestions})
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
-        logger.error(f"Erro ao listar vídeos: {e}")
+        logger.error(f"Erro nas sugestões: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/videos/<int:video_id>', methods=['GET'])
 def get_video(video_id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT v.id, v.title, v.description, v.filename, v.url, v.upload_date, u.username 
-            FROM videos v 
-            LEFT JOIN users u ON v.user_id = u.id 
-            WHERE v.id = %s
-        """, (video_id,))
-        video = cur.fetchone()
-        cur.close()
-        conn.close()
+        def build(lsn):
+            rows = execute_read_query(f"{VIDEO_SELECT} WHERE v.id = %s", (video_id,), min_lsn=lsn)
+            return app.json.dumps(video_to_dict(rows[0])).encode() if rows else None
 
-        if video:
-            video_data = {
-                'id': video[0],
-                'title': video[1],
-                'description': video[2],
-                'filename': video[3],
-                'url': video[4],
-                'upload_date': video[5].isoformat() if video[5] else None,
-                'uploaded_by': video[6] or 'Unknown'
-            }
-            return jsonify(video_data)
+        document = catalog_cache.fetch(('video', video_id), read_min_lsn(), build)
+        if document:
+            return document_response(document)
         else:
             return jsonify({"error": "Video not found"}), 404
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
         logger.error(f"Erro ao buscar vídeo {video_id}: {e}")
         return jsonify({"error": str(e)}), 500
@@ -258,37 +879,14 @@ def get_my_videos():
         if not user:
             return jsonify({"error": "Token inválido ou expirado"}), 401
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT v.id, v.title, v.description, v.filename, v.url, v.upload_date, u.username 
-            FROM videos v 
-            LEFT JOIN users u ON v.user_id = u.id 
-            WHERE v.user_id = %s
-            ORDER BY v.upload_date DESC
-        """, (user['id'],))
-        
-        videos = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        videos_list = []
-        for video in videos:
-            video_data = {
-                'id': video[0],
-                'title': video[1],
-                'description': video[2],
-                'filename': video[3],
-                'url': video[4],
-                'upload_date': video[5].isoformat() if video[5] else None,
-                'uploaded_by': video[6] or 'Unknown'
-            }
-            videos_list.append(video_data)
-        
-        return jsonify(videos_list)
+        return videos_response(user['id'])
+    except HTTPException as e:
+        return jsonify({"error": e.description}), e.code
     except Exception as e:
         logger.error(f"Erro ao buscar vídeos do usuário: {e}")
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True)
\ No newline at end of file
+    # Sem reloader: o processo pai do reloader também importaria o módulo e
+    # arrancaria outra vez as threads de fundo (publisher, outbox, listeners, índice)
+    app.run(host="0.0.0.0", port=8000, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Cache de respostas do catálogo - Catalog Service
+
+O catálogo só muda com uploads e resultados do processamento, por isso as
+listagens e os documentos de cada vídeo são guardados já serializados:
+- Invalidação por eventos (exchange fanout catalog_events no RabbitMQ),
+  publicados pelo upload e pelo video_processor
+- Versão: um preenchimento que começou antes de uma invalidação não é guardado
+- Coerência com as réplicas: os eventos trazem o LSN do commit e os
+  preenchimentos seguintes só leem réplicas que já o aplicaram
+- ETag = hash do corpo (igual em todas as instâncias) para respostas 304
+- Sem ligação aos eventos a cache fica desligada (não há como a invalidar)
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import pika
+from prometheus_client import Counter, Gauge
+
+from db import db_connection, current_wal_lsn, lsn_to_int
+
+logger = logging.getLogger(__name__)
+
+CATALOG_EVENTS_EXCHANGE = 'catalog_events'
+
+# Limite de memória da cache e de cada documento (listagens maiores não são guardadas)
+CATALOG_CACHE_MAX_BYTES = int(os.environ.get('CATALOG_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+CATALOG_CACHE_MAX_ENTRY_BYTES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRY_BYTES', str(8 * 1024 * 1024)))
+
+# Rede de segurança para eventos perdidos
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '300'))
+
+# max-age do Cache-Control (0: o cliente revalida sempre com If-None-Match)
+CATALOG_CACHE_MAX_AGE = int(os.environ.get('CATALOG_CACHE_MAX_AGE', '0'))
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+CATALOG_CACHE_LOOKUPS = Counter('catalog_response_cache_lookups_total', 'Catalog response cache lookups', ['kind', 'result'])
+CATALOG_CACHE_INVALIDATIONS = Counter('catalog_response_cache_invalidations_total', 'Catalog cache invalidations', ['source'])
+CATALOG_CACHE_BYTES = Gauge('catalog_response_cache_bytes', 'Serialized bytes held by the catalog response cache')
+CATALOG_CACHE_ENABLED = Gauge('catalog_response_cache_enabled', 'Whether the catalog cache is receiving invalidation events')
+
+CachedDocument = namedtuple('CachedDocument', ['body', 'etag', 'stored_at'])
+
+def document_etag(body):
+    """ETag forte a partir do conteúdo (as instâncias concordam sem coordenação)."""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+def make_document(body):
+    return CachedDocument(body, document_etag(body), time.time())
+
+def max_lsn(*lsns):
+    """Maior dos LSNs dados (None é ignorado)."""
+    present = [lsn for lsn in lsns if lsn]
+    return max(present, key=lsn_to_int) if present else None
+
+class CatalogCache:
+    """
+    Cache LRU de documentos JSON serializados.
+
+    Chaves: ('list', user_id, ...) para listagens e ('video', id) para
+    vídeos. Qualquer mudança invalida todas as listagens e os vídeos tocados.
+    """
+
+    def __init__(self, max_bytes=CATALOG_CACHE_MAX_BYTES, max_entry_bytes=CATALOG_CACHE_MAX_ENTRY_BYTES,
+                 ttl=CATALOG_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Incrementada em cada invalidação
+        self.version = 0
+        # LSN mais recente anunciado (os preenchimentos leem pelo menos até aqui)
+        self.known_lsn = None
+        self.enabled = False
+
+    def _kind(self, key):
+        return key[0]
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def usable_for(self, min_lsn):
+        """
+        A cache serve o pedido se estiver ligada aos eventos e já conhecer
+        o LSN pedido (read-your-writes: o evento desse upload já chegou).
+        """
+        if not self.enabled:
+            return False
+        if not min_lsn:
+            return True
+        return self.known_lsn is not None and lsn_to_int(min_lsn) <= lsn_to_int(self.known_lsn)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.stored_at > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        CATALOG_CACHE_LOOKUPS.labels(kind=self._kind(key), result='hit' if entry else 'miss').inc()
+        return entry
+
+    def begin_fill(self, min_lsn=None):
+        """(versão, LSN mínimo) a usar num preenchimento; guardar com store(..., version)."""
+        return self.version, max_lsn(min_lsn, self.known_lsn)
+
+    def store(self, key, body, version):
+        """
+        Guarda o corpo se nada foi invalidado desde begin_fill.
+
+        Devolve sempre o CachedDocument (com ETag) para a resposta.
+        """
+        document = make_document(body)
+        if len(body) > self.max_entry_bytes:
+            return document
+        with self._lock:
+            if not self.enabled or version != self.version:
+                return document
+            self._drop(key)
+            self._entries[key] = document
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes and self._entries:
+                self._drop(next(iter(self._entries)))
+            CATALOG_CACHE_BYTES.set(self._bytes)
+        return document
+
+    def fetch(self, key, min_lsn, build):
+        """
+        Documento da cache ou, no miss, build(min_lsn) -> bytes (None = não existe).
+
+        Pedidos que a cache não pode servir (min_lsn ainda desconhecido) vão
+        direto à base de dados sem guardar o resultado.
+        """
+        if not self.usable_for(min_lsn):
+            CATALOG_CACHE_LOOKUPS.labels(kind=self._kind(key), result='bypass').inc()
+            body = build(min_lsn)
+            return make_document(body) if body is not None else None
+
+        document = self.get(key)
+        if document is not None:
+            return document
+
+        version, fill_lsn = self.begin_fill(min_lsn)
+        body = build(fill_lsn)
+        return self.store(key, body, version) if body is not None else None
+
+    def fetch_many(self, keys, min_lsn, build_many):
+        """
+        Vários documentos de uma vez: os misses vão todos num único
+        build_many(keys, min_lsn) -> {key: bytes} (chaves ausentes = não existem).
+
+        Devolve {key: CachedDocument} só com as chaves encontradas.
+        """
+        documents = {}
+        if not self.usable_for(min_lsn):
+            for key in keys:
+                CATALOG_CACHE_LOOKUPS.labels(kind=self._kind(key), result='bypass').inc()
+            missing, fill_lsn, version = list(keys), min_lsn, None
+        else:
+            for key in keys:
+                document = self.get(key)
+                if document is not None:
+                    documents[key] = document
+            missing = [key for key in keys if key not in documents]
+            version, fill_lsn = self.begin_fill(min_lsn)
+
+        if missing:
+            for key, body in build_many(missing, fill_lsn).items():
+                documents[key] = make_document(body) if version is None else self.store(key, body, version)
+        return documents
+
+    def invalidate(self, video_ids=None, lsn=None, source='event'):
+        """Remove todas as listagens e os vídeos indicados (todos se video_ids=None)."""
+        with self._lock:
+            self.version += 1
+            if lsn:
+                self.known_lsn = max_lsn(lsn, self.known_lsn)
+            ids = set(video_ids) if video_ids is not None else None
+            for key in list(self._entries):
+                if key[0] == 'list' or ids is None or key[1] in ids:
+                    self._drop(key)
+            CATALOG_CACHE_BYTES.set(self._bytes)
+        CATALOG_CACHE_INVALIDATIONS.labels(source=source).inc()
+
+    def reset(self, lsn):
+        """Ligação aos eventos (re)estabelecida em lsn: começar vazia e ligada."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.known_lsn = max_lsn(lsn, self.known_lsn)
+            self.enabled = True
+            CATALOG_CACHE_BYTES.set(0)
+        CATALOG_CACHE_ENABLED.set(1)
+
+    def disable(self):
+        """Sem eventos não há invalidação: deixar de servir da cache."""
+        with self._lock:
+            self.enabled = False
+            self.version += 1
+            self._entries.clear()
+            self._bytes = 0
+            CATALOG_CACHE_BYTES.set(0)
+        CATALOG_CACHE_ENABLED.set(0)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "version": self.version,
+            "known_lsn": self.known_lsn,
+        }
+
+def catalog_event(video_ids, lsn, event='videos_changed', videos=None):
+    """
+    Corpo JSON de um evento de mudança no catálogo.
+
+    videos ([{id, title}]) acompanha os uploads, para o índice de sugestões.
+    """
+    body = {"event": event, "video_ids": list(video_ids), "lsn": lsn}
+    if videos:
+        body["videos"] = videos
+    return json.dumps(body)
+
+class CatalogEventsListener:
+    """
+    Consome catalog_events e invalida a cache (uma fila exclusiva por processo).
+
+    subscribers(event) recebem também cada evento (ex.: índice de sugestões).
+    """
+
+    def __init__(self, cache, parameters, subscribers=()):
+        self.cache = cache
+        self.parameters = parameters
+        self.subscribers = list(subscribers)
+        self._thread = None
+
+    def _on_event(self, channel, method, properties, body):
+        try:
+            event = json.loads(body)
+            self.cache.invalidate(event.get('video_ids'), event.get('lsn'))
+        except (ValueError, AttributeError):
+            logger.warning("Evento do catálogo inválido; a limpar a cache")
+            self.cache.invalidate()
+            return
+        for subscriber in self.subscribers:
+            try:
+                subscriber(event)
+            except Exception as e:
+                logger.error(f"Erro a tratar evento do catálogo: {e}")
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                connection = pika.BlockingConnection(self.parameters)
+                channel = connection.channel()
+                channel.exchange_declare(exchange=CATALOG_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+                result = channel.queue_declare(queue='', exclusive=True)
+                channel.queue_bind(exchange=CATALOG_EVENTS_EXCHANGE, queue=result.method.queue)
+                channel.basic_consume(queue=result.method.queue, on_message_callback=self._on_event, auto_ack=True)
+
+                # Tudo o que foi escrito até agora está neste LSN; o resto chega por eventos
+                with db_connection() as conn:
+                    lsn = current_wal_lsn(conn)
+                self.cache.reset(lsn)
+                delay = 1
+                logger.info(f"✅ A escutar eventos do catálogo (cache ligada em {lsn})")
+                channel.start_consuming()
+            except Exception as e:
+                logger.warning(f"⚠️ Ligação de eventos do catálogo perdida: {e!r}")
+            self.cache.disable()
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='catalog-events')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
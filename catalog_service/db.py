@@ -5,7 +5,9 @@ Suporte para replicação Master-Slave PostgreSQL
 
 FUNCIONALIDADE 5: Estratégias de Replicação de Dados
 - Master: Operações de escrita (INSERT, UPDATE, DELETE)
-- Slave: Operações de leitura (SELECT)
+- Réplicas (DB_REPLICAS): Operações de leitura (SELECT), cada uma com o seu pool
+- Health checks em background: réplicas em baixo ou atrasadas saem das leituras
+  e voltam sozinhas quando recuperam
 - Failover automático em caso de falha
 """
 
@@ -14,7 +16,13 @@ import psycopg2.pool
 import os
 import logging
 import time
+import threading
 from functools import wraps
+from contextlib import contextmanager
+from collections import namedtuple
+
+import psycopg2.extensions
+from prometheus_client import Counter, Gauge, Histogram
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -44,42 +52,371 @@ SLAVE_CONFIG = {
     'sslmode': 'prefer'
 }
 
+# Réplicas de leitura: "host[:port[:weight]]" separados por vírgulas
+# (por omissão, só DB_SLAVE_HOST/DB_SLAVE_PORT com peso 1)
+DB_REPLICAS = os.environ.get('DB_REPLICAS', f"{SLAVE_CONFIG['host']}:{SLAVE_CONFIG['port']}:1")
+
+# Conexões por réplica (cada réplica tem o seu pool)
+REPLICA_POOL_SIZE = int(os.environ.get('DB_REPLICA_POOL_SIZE', '20'))
+
+# Réplicas com replay lag acima deste valor (segundos) não recebem leituras
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+
+# Intervalo entre health checks (lag e LSN) de cada réplica, em background
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', '1'))
+
+# Verificações boas seguidas para uma réplica voltar a receber leituras
+REPLICA_REJOIN_CHECKS = int(os.environ.get('REPLICA_REJOIN_CHECKS', '2'))
+
+# Timeout de conexão (e de statement) do health check
+REPLICA_CHECK_TIMEOUT = int(os.environ.get('REPLICA_CHECK_TIMEOUT', '2'))
+
+# Lag e LSN aplicado; sem WAL pendente o lag é 0 (master parado não conta como atraso)
+REPLICA_STATUS_SQL = """
+    SELECT CASE
+               WHEN NOT pg_is_in_recovery() THEN 0
+               WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+               ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END,
+           CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text
+"""
+
+REPLICA_LAG = Gauge('catalog_replica_lag_seconds', 'Replay lag of the read replica', ['replica'])
+REPLICA_HEALTHY = Gauge('catalog_replica_healthy', 'Whether the replica is receiving reads', ['replica'])
+REPLICA_STATE_CHANGES = Counter('catalog_replica_state_changes_total', 'Replicas leaving or rejoining the read set', ['replica', 'state'])
+READ_ROUTING = Counter('catalog_read_routing_total', 'Read connections by target and reason', ['target', 'reason'])
+
+# Tempo máximo à espera de uma conexão livre no pool
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get('DB_POOL_CHECKOUT_TIMEOUT', '10'))
+
+# Conexões paradas há mais tempo do que isto são testadas (SELECT 1) no checkout
+POOL_VALIDATE_IDLE_SECONDS = float(os.environ.get('DB_POOL_VALIDATE_IDLE_SECONDS', '30'))
+
+POOL_IN_USE = Gauge('catalog_db_pool_in_use', 'Connections checked out of the pool', ['pool'])
+POOL_WAIT = Histogram(
+    'catalog_db_pool_wait_seconds', 'Time waiting for a free pool slot', ['pool'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+)
+POOL_CHECKOUT = Histogram(
+    'catalog_db_pool_checkout_seconds', 'Total checkout latency (wait + connect + validation)', ['pool'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+)
+POOL_DISCARDED = Counter('catalog_db_pool_discarded_total', 'Connections closed instead of reused', ['pool', 'reason'])
+POOL_LEAKS = Counter('catalog_db_pool_leaks_total', 'Connections still checked out when their request ended')
+POOL_OLDEST_CHECKOUT = Gauge('catalog_db_pool_oldest_checkout_seconds', 'Age of the oldest checked out connection')
+
+READ_QUERIES = Counter('catalog_db_read_queries_total', 'Read queries by outcome (executed or coalesced into an in-flight one)', ['result'])
+READ_QUERY_WAITERS = Histogram(
+    'catalog_db_read_query_waiters', 'Callers that shared each executed read query',
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100)
+)
+
 # Pool de conexões
 master_pool = None
-slave_pool = None
+read_replicas = []
+
+# Conexões fora do pool: id(conn) -> CheckedOut
+CheckedOut = namedtuple('CheckedOut', ['conn', 'pool', 'since', 'owner'])
+_checked_out = {}
+_last_returned = {}
+_pool_slots = {}
+_pool_in_use = {}
+_pool_names = {}
+_pool_slots_lock = threading.Lock()
+
+POOL_OLDEST_CHECKOUT.set_function(
+    lambda: max((time.time() - entry.since for entry in list(_checked_out.values())), default=0)
+)
+
+_health_thread = None
+_init_lock = threading.Lock()
+
+def parse_replicas(spec):
+    """'host[:port[:weight]],...' -> [(host, port, weight)]."""
+    result = []
+    for item in spec.split(','):
+        parts = item.strip().split(':')
+        if not parts[0]:
+            continue
+        port = int(parts[1]) if len(parts) > 1 and parts[1] else SLAVE_CONFIG['port']
+        weight = float(parts[2]) if len(parts) > 2 and parts[2] else 1.0
+        if weight <= 0:
+            raise ValueError(f"Peso inválido para a réplica {parts[0]}: {weight}")
+        result.append((parts[0], port, weight))
+    return result
+
+class Replica:
+    """
+    Réplica de leitura com pool próprio e estado do último health check.
+    
+    Sai do conjunto de leituras em erro ou lag acima do máximo e volta
+    sozinha após REPLICA_REJOIN_CHECKS verificações boas seguidas.
+    """
+    
+    def __init__(self, host, port, weight=1.0):
+        self.name = f"{host}:{port}"
+        self.weight = weight
+        self.config = dict(SLAVE_CONFIG, host=host, port=port)
+        # minconn=0: criar o pool não liga à réplica (pode ainda estar em baixo)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(minconn=0, maxconn=REPLICA_POOL_SIZE, **self.config)
+        _pool_names[id(self.pool)] = self.name
+        self.healthy = False
+        self.state = 'unknown'
+        self.lag = None
+        self.replay_lsn = None
+        self.checked_at = 0
+        self._good_checks = 0
+        self._check_conn = None
+        # Conexões devolvidas antes do último regresso são validadas no checkout
+        self.validate_before = 0
+    
+    @property
+    def outstanding(self):
+        return _pool_in_use.get(id(self.pool), 0)
+    
+    def load(self):
+        """Pedidos em curso por unidade de peso (escolhe-se a menor)."""
+        return self.outstanding / self.weight
+    
+    def has_applied(self, min_lsn):
+        return not min_lsn or (self.replay_lsn is not None and lsn_to_int(self.replay_lsn) >= lsn_to_int(min_lsn))
+    
+    def record_status(self, lag, replay_lsn):
+        self.lag, self.replay_lsn, self.checked_at = lag, replay_lsn, time.time()
+        REPLICA_LAG.labels(replica=self.name).set(lag)
+    
+    def check(self):
+        """Health check: lag e LSN aplicado numa conexão dedicada."""
+        try:
+            if self._check_conn is None or self._check_conn.closed:
+                self._check_conn = psycopg2.connect(
+                    connect_timeout=REPLICA_CHECK_TIMEOUT,
+                    options=f"-c statement_timeout={REPLICA_CHECK_TIMEOUT * 1000}",
+                    **self.config
+                )
+                self._check_conn.set_session(readonly=True, autocommit=True)
+            cursor = self._check_conn.cursor()
+            cursor.execute(REPLICA_STATUS_SQL)
+            lag, replay_lsn = cursor.fetchone()
+            cursor.close()
+        except Exception as e:
+            if self._check_conn is not None and not self._check_conn.closed:
+                self._check_conn.close()
+            self._check_conn = None
+            self.mark_down('error', e)
+            return
+        
+        self.record_status(float(lag), replay_lsn)
+        if self.lag > REPLICA_MAX_LAG_SECONDS:
+            self.mark_down('lag', f"lag {self.lag:.1f}s")
+            return
+        
+        self._good_checks += 1
+        # No arranque basta uma verificação; depois de uma falha exige-se REPLICA_REJOIN_CHECKS
+        needed = 1 if self.state == 'unknown' else REPLICA_REJOIN_CHECKS
+        if not self.healthy and self._good_checks >= needed:
+            self.validate_before = time.time()
+            self.healthy = True
+            self.state = 'ok'
+            REPLICA_HEALTHY.labels(replica=self.name).set(1)
+            REPLICA_STATE_CHANGES.labels(replica=self.name, state='rejoined').inc()
+            logger.info(f"✅ Réplica {self.name} a receber leituras (lag {self.lag:.1f}s)")
+    
+    def mark_down(self, state, reason):
+        """Tira a réplica do conjunto de leituras até voltar a passar nos checks."""
+        self._good_checks = 0
+        self.state = state
+        if self.healthy:
+            self.healthy = False
+            REPLICA_HEALTHY.labels(replica=self.name).set(0)
+            REPLICA_STATE_CHANGES.labels(replica=self.name, state='removed').inc()
+            logger.warning(f"⚠️ Réplica {self.name} fora das leituras ({state}): {reason}")
+    
+    def stats(self):
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "state": self.state,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "lag_seconds": self.lag,
+            "replay_lsn": self.replay_lsn,
+        }
+
+def _run_health_checks():
+    while True:
+        for replica in list(read_replicas):
+            replica.check()
+        time.sleep(REPLICA_LAG_CHECK_INTERVAL)
 
 def init_connection_pools():
     """Inicializar pools de conexão"""
-    global master_pool, slave_pool
+    global master_pool, read_replicas, _health_thread
     
-    try:
-        # Pool para Master (escritas)
-        master_pool = psycopg2.pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=10,
-            **MASTER_CONFIG
-        )
-        logger.info("✅ Pool Master inicializado")
-        
-        # Pool para Slave (leituras)
-        slave_pool = psycopg2.pool.ThreadedConnectionPool(
-            minconn=1,
-            maxconn=20,  # Mais conexões para leituras
-            **SLAVE_CONFIG
-        )
-        logger.info("✅ Pool Slave inicializado")
+    with _init_lock:
+        if master_pool is None:
+            # Pool para Master (escritas)
+            try:
+                master_pool = psycopg2.pool.ThreadedConnectionPool(
+                    minconn=1,
+                    maxconn=10,
+                    **MASTER_CONFIG
+                )
+            except Exception as e:
+                logger.error(f"❌ Erro ao inicializar pool Master: {e}")
+                raise
+            _pool_names[id(master_pool)] = 'master'
+            logger.info("✅ Pool Master inicializado")
         
-    except Exception as e:
-        logger.error(f"❌ Erro ao inicializar pools: {e}")
-        # Fallback: usar apenas master
-        if not master_pool:
-            master_pool = psycopg2.pool.ThreadedConnectionPool(
-                minconn=1,
-                maxconn=15,
-                **MASTER_CONFIG
-            )
-        slave_pool = master_pool
-        logger.warning("⚠️ Usando apenas Master (modo fallback)")
+        if _health_thread is None:
+            # Pools das réplicas (leituras); entram nas leituras após o primeiro health check
+            read_replicas = [Replica(host, port, weight) for host, port, weight in parse_replicas(DB_REPLICAS)]
+            for replica in read_replicas:
+                replica.check()
+            logger.info(f"✅ {len(read_replicas)} réplica(s) configurada(s), {sum(r.healthy for r in read_replicas)} disponível(is)")
+            
+            _health_thread = threading.Thread(target=_run_health_checks, name='replica-health')
+            _health_thread.daemon = True
+            _health_thread.start()
+
+# ================================================================
+# CHECKOUT / CHECKIN
+# ================================================================
+
+def _pool_name(pool):
+    return _pool_names.get(id(pool), 'replica')
+
+def _slots(pool):
+    """Semáforo com maxconn lugares: sem lugar livre espera-se em vez de PoolError."""
+    with _pool_slots_lock:
+        if id(pool) not in _pool_slots:
+            _pool_slots[id(pool)] = threading.BoundedSemaphore(pool.maxconn)
+        return _pool_slots[id(pool)]
+
+def _connection_ok(conn, validate_before=0):
+    """Valida uma conexão antes de a entregar."""
+    if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    last_returned = _last_returned.get(id(conn), time.time())
+    if time.time() - last_returned < POOL_VALIDATE_IDLE_SECONDS and last_returned >= validate_before:
+        return True
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        cursor.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def checkout(pool, timeout=POOL_CHECKOUT_TIMEOUT, validate_before=0):
+    """
+    Tira uma conexão válida do pool (devolver com checkin/return_db_connection).
+    
+    Conexões devolvidas antes de validate_before são sempre testadas.
+    """
+    name = _pool_name(pool)
+    start_time = time.time()
+    slots = _slots(pool)
+    if not slots.acquire(timeout=timeout):
+        raise psycopg2.pool.PoolError(f"Pool {name} esgotado: sem conexão livre em {timeout}s")
+    POOL_WAIT.labels(pool=name).observe(time.time() - start_time)
+    
+    try:
+        for _ in range(pool.maxconn + 1):
+            conn = pool.getconn()
+            if _connection_ok(conn, validate_before):
+                break
+            POOL_DISCARDED.labels(pool=name, reason='invalid').inc()
+            _last_returned.pop(id(conn), None)
+            pool.putconn(conn, close=True)
+        else:
+            raise psycopg2.OperationalError(f"Sem conexões válidas no pool {name}")
+    except Exception:
+        slots.release()
+        raise
+    
+    _checked_out[id(conn)] = CheckedOut(conn, pool, time.time(), threading.get_ident())
+    with _pool_slots_lock:
+        _pool_in_use[id(pool)] = _pool_in_use.get(id(pool), 0) + 1
+    POOL_IN_USE.labels(pool=name).inc()
+    POOL_CHECKOUT.labels(pool=name).observe(time.time() - start_time)
+    return conn
+
+def checkin(conn, discard=False):
+    """Devolve a conexão ao pool de onde saiu (discard=True fecha-a)."""
+    entry = _checked_out.pop(id(conn), None)
+    if entry is None:
+        # Conexão direta (fora do pool)
+        if not conn.closed:
+            conn.close()
+        return
+    
+    name = _pool_name(entry.pool)
+    discard = discard or conn.closed != 0
+    if discard:
+        POOL_DISCARDED.labels(pool=name, reason='broken').inc()
+        _last_returned.pop(id(conn), None)
+    try:
+        entry.pool.putconn(conn, close=discard)
+        if not discard:
+            _last_returned[id(conn)] = time.time()
+    finally:
+        _slots(entry.pool).release()
+        with _pool_slots_lock:
+            _pool_in_use[id(entry.pool)] -= 1
+        POOL_IN_USE.labels(pool=name).dec()
+
+def detach(conn):
+    """
+    Desliga a conexão do pedido atual (ex.: resposta em streaming que a
+    devolve no fim do gerador); deixa de contar como fuga no teardown.
+    """
+    entry = _checked_out.get(id(conn))
+    if entry:
+        _checked_out[id(conn)] = entry._replace(owner=None)
+
+def release_thread_connections():
+    """
+    Devolve conexões que a thread atual ainda tem fora do pool.
+    
+    Chamado no fim de cada pedido (teardown): qualquer conexão encontrada
+    aqui é uma fuga e é contada em catalog_db_pool_leaks_total.
+    """
+    owner = threading.get_ident()
+    leaked = [entry.conn for entry in list(_checked_out.values()) if entry.owner == owner]
+    for conn in leaked:
+        entry = _checked_out[id(conn)]
+        POOL_LEAKS.inc()
+        logger.warning(f"⚠️ Conexão {_pool_name(entry.pool)} não devolvida no fim do pedido; a recuperar")
+        try:
+            if not conn.closed:
+                conn.rollback()
+            checkin(conn)
+        except Exception as e:
+            logger.error(f"Erro ao recuperar conexão: {e}")
+            checkin(conn, discard=True)
+    return len(leaked)
+
+@contextmanager
+def db_connection(readonly=False, min_lsn=None):
+    """
+    Conexão com âmbito: commit no fim (escrita), rollback em erro e
+    devolução ao pool sempre.
+    
+    readonly=True usa get_replica_read_connection (réplica quando possível).
+    """
+    conn = get_replica_read_connection(min_lsn) if readonly else get_db_connection()
+    try:
+        yield conn
+        if not readonly:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        return_db_connection(conn)
 
 def get_db_connection(readonly=False, retries=3):
     """
@@ -92,28 +429,23 @@ def get_db_connection(readonly=False, retries=3):
     Returns:
         psycopg2.connection: Conexão com a base de dados
     """
-    global master_pool, slave_pool
+    global master_pool
     
     # Inicializar pools se necessário
-    if not master_pool or not slave_pool:
+    if not master_pool:
         init_connection_pools()
     
     for attempt in range(retries):
         try:
-            if readonly and slave_pool != master_pool:
-                # Usar slave para leituras
-                conn = slave_pool.getconn()
-                if conn:
-                    # Verificar se a conexão está válida
-                    conn.set_session(readonly=True, autocommit=True)
-                    logger.debug("🔵 Conexão obtida: SLAVE (readonly)")
-                    return conn
-                else:
-                    logger.warning("⚠️ Slave pool esgotado, tentando master...")
-                    raise Exception("Slave pool exhausted")
+            if readonly:
+                # Réplica com menos pedidos em curso (ou master se nenhuma estiver disponível)
+                conn = get_replica_read_connection()
+                conn.set_session(readonly=True, autocommit=True)
+                logger.debug(f"🔵 Conexão obtida: {_pool_name(_checked_out[id(conn)].pool)} (readonly)")
+                return conn
             
             # Usar master para escritas ou como fallback
-            conn = master_pool.getconn()
+            conn = checkout(master_pool)
             if conn:
                 conn.set_session(readonly=readonly, autocommit=False)
                 logger.debug(f"🔴 Conexão obtida: MASTER ({'readonly' if readonly else 'read/write'})")
@@ -126,9 +458,9 @@ def get_db_connection(readonly=False, retries=3):
             if attempt == retries - 1:
                 # Última tentativa: tentar conexão direta
                 try:
-                    config = SLAVE_CONFIG if readonly else MASTER_CONFIG
-                    conn = psycopg2.connect(**config)
-                    logger.info(f"✅ Conexão direta estabelecida ({'SLAVE' if readonly else 'MASTER'})")
+                    # As leituras já caem no master quando não há réplica disponível
+                    conn = psycopg2.connect(**MASTER_CONFIG)
+                    logger.info("✅ Conexão direta estabelecida (MASTER)")
                     return conn
                 except Exception as direct_error:
                     logger.error(f"❌ Falha na conexão direta: {direct_error}")
@@ -138,6 +470,85 @@ def get_db_connection(readonly=False, retries=3):
     
     raise Exception("Não foi possível estabelecer conexão com a base de dados")
 
+def lsn_to_int(lsn):
+    """'16/B374D848' -> posição numérica no WAL."""
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) | int(low, 16)
+
+def current_wal_lsn(conn):
+    """LSN atual do master (token de read-your-writes após um commit)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_current_wal_lsn()::text")
+    lsn = cursor.fetchone()[0]
+    cursor.close()
+    conn.commit()
+    return lsn
+
+def replica_status(replica, conn):
+    """
+    Verifica já (lag, replay_lsn) da réplica na conexão do pedido.
+    
+    Usado quando o LSN do último health check ainda não chega para min_lsn.
+    """
+    cursor = conn.cursor()
+    cursor.execute(REPLICA_STATUS_SQL)
+    lag, replay_lsn = cursor.fetchone()
+    cursor.close()
+    conn.rollback()
+    replica.record_status(float(lag), replay_lsn)
+    return replica.lag, replica.replay_lsn
+
+def choose_replica(min_lsn=None):
+    """
+    Réplica saudável com menos pedidos em curso por unidade de peso,
+    preferindo as que já aplicaram min_lsn.
+    
+    Returns:
+        (replica ou None, motivo para ir ao master)
+    """
+    if not read_replicas:
+        return None, 'no_replica'
+    healthy = [replica for replica in read_replicas if replica.healthy]
+    if not healthy:
+        return None, 'lag' if any(replica.state == 'lag' for replica in read_replicas) else 'error'
+    caught_up = [replica for replica in healthy if replica.has_applied(min_lsn)]
+    return min(caught_up or healthy, key=Replica.load), 'ok'
+
+def get_replica_read_connection(min_lsn=None):
+    """
+    Conexão de leitura: réplica saudável menos carregada (e, com min_lsn,
+    que já tenha aplicado esse LSN); caso contrário, master.
+    
+    Devolver sempre com return_db_connection(conn).
+    """
+    if not master_pool:
+        init_connection_pools()
+    
+    replica, reason = choose_replica(min_lsn)
+    if replica is not None:
+        conn = None
+        try:
+            conn = checkout(replica.pool, validate_before=replica.validate_before)
+            conn.set_session(readonly=True, autocommit=False)
+            if not replica.has_applied(min_lsn):
+                replica_status(replica, conn)
+            
+            if replica.has_applied(min_lsn):
+                READ_ROUTING.labels(target=replica.name, reason='ok').inc()
+                return conn
+            reason = 'lsn'
+        except Exception as e:
+            logger.warning(f"⚠️ Réplica {replica.name} indisponível para leitura: {e}")
+            replica.mark_down('error', e)
+            reason = 'error'
+        if conn is not None:
+            checkin(conn, discard=reason == 'error')
+    
+    READ_ROUTING.labels(target='master', reason=reason).inc()
+    conn = checkout(master_pool)
+    conn.set_session(readonly=True, autocommit=False)
+    return conn
+
 def return_db_connection(conn, readonly=False):
     """
     Retornar conexão para o pool
@@ -146,13 +557,9 @@ def return_db_connection(conn, readonly=False):
         conn: Conexão a ser retornada
         readonly (bool): Se a conexão era readonly
     """
-    global master_pool, slave_pool
-    
+    # O pool de origem é conhecido pelo checkout (readonly fica por compatibilidade)
     try:
-        if readonly and slave_pool != master_pool:
-            slave_pool.putconn(conn)
-        else:
-            master_pool.putconn(conn)
+        checkin(conn)
     except Exception as e:
         logger.error(f"Erro ao retornar conexão: {e}")
 
@@ -247,23 +654,77 @@ def with_write_connection(func):
 # FUNÇÕES DE CONVENIÊNCIA
 # ================================================================
 
-@with_read_connection
-def execute_read_query(conn, query, params=None):
+class _Flight:
+    """Execução em curso de uma query, partilhada por quem pedir a mesma."""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+def single_flight(key, func):
+    """
+    Chamadas concorrentes com a mesma chave esperam por uma só execução
+    de func() e recebem o mesmo resultado (ou a mesma exceção).
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+        else:
+            flight.waiters += 1
+    
+    if not leader:
+        flight.done.wait()
+        READ_QUERIES.labels(result='coalesced').inc()
+        if flight.error is not None:
+            raise flight.error
+        return list(flight.result)
+    
+    try:
+        flight.result = func()
+        return list(flight.result)
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        # Quem chegar depois daqui executa de novo (não há cache de resultados)
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+        READ_QUERIES.labels(result='executed').inc()
+        READ_QUERY_WAITERS.observe(flight.waiters)
+
+def execute_read_query(query, params=None, min_lsn=None):
     """
-    Executar query de leitura no slave
+    Executar query de leitura numa réplica (ou no master, ver get_replica_read_connection)
+    
+    Queries idênticas em simultâneo (mesmo SQL normalizado, parâmetros e
+    min_lsn) são executadas uma só vez e o resultado é partilhado.
     
     Args:
         query (str): SQL query
         params (tuple): Parâmetros da query
+        min_lsn (str): LSN que a réplica já tem de ter aplicado
     
     Returns:
         list: Resultados da query
     """
-    cursor = conn.cursor()
-    cursor.execute(query, params or ())
-    results = cursor.fetchall()
-    cursor.close()
-    return results
+    def run():
+        with db_connection(readonly=True, min_lsn=min_lsn) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params or ())
+            results = cursor.fetchall()
+            cursor.close()
+        return results
+    
+    key = (' '.join(query.split()), repr(params), min_lsn)
+    return single_flight(key, run)
 
 @with_write_connection  
 def execute_write_query(conn, query, params=None):
@@ -376,6 +837,9 @@ def get_replication_status():
     except Exception as e:
         status['slave'] = {'error': str(e)}
     
+    # Estado de cada réplica no último health check
+    status['replicas'] = [replica.stats() for replica in read_replicas]
+    
     return status
 
 # ================================================================
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Transactional outbox do upload -> processamento - Catalog Service
+
+O upload escreve a mensagem na tabela processing_outbox na mesma transação
+do INSERT do vídeo; um relay em background publica-a no RabbitMQ.
+- Lotes com FOR UPDATE SKIP LOCKED (vários processos podem correr o relay)
+- Só marca published_at depois do confirm do broker (at-least-once)
+- Métricas de backlog (mensagens por publicar) e lag (idade da mais antiga)
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from db import get_db_connection, return_db_connection
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '1.0'))
+
+# Tempo máximo à espera dos confirms de um lote
+OUTBOX_CONFIRM_TIMEOUT = float(os.environ.get('OUTBOX_CONFIRM_TIMEOUT', '10'))
+
+# Mensagens já publicadas ficam este tempo na tabela (auditoria) e depois são apagadas
+OUTBOX_RETENTION_HOURS = int(os.environ.get('OUTBOX_RETENTION_HOURS', '24'))
+OUTBOX_CLEANUP_INTERVAL = 3600
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+OUTBOX_BACKLOG = Gauge('catalog_outbox_backlog', 'Outbox messages not yet published')
+OUTBOX_LAG = Gauge('catalog_outbox_lag_seconds', 'Age of the oldest unpublished outbox message')
+OUTBOX_RELAYED = Counter('catalog_outbox_relayed_total', 'Outbox messages published and confirmed')
+OUTBOX_UNCONFIRMED = Counter('catalog_outbox_unconfirmed_total', 'Outbox messages left for retry (nack or confirm timeout)')
+OUTBOX_ERRORS = Counter('catalog_outbox_relay_errors_total', 'Outbox relay iterations that failed')
+OUTBOX_DELIVERY_LAG = Histogram(
+    'catalog_outbox_delivery_seconds', 'Time from the upload commit to the broker confirm',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+OUTBOX_BATCH = Histogram(
+    'catalog_outbox_batch_size', 'Messages relayed per batch',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)
+)
+
+def enqueue_outbox(cursor, video_id, routing_key, payload):
+    """Escreve a mensagem na outbox com o cursor (e a transação) de quem chama."""
+    cursor.execute(
+        "INSERT INTO processing_outbox (video_id, routing_key, payload) VALUES (%s, %s, %s)",
+        (video_id, routing_key, json.dumps(payload))
+    )
+
+class OutboxRelay:
+    """Thread que drena processing_outbox para o RabbitMQ em lotes."""
+
+    def __init__(self, publisher, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.publisher = publisher
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wake_event = threading.Event()
+        self._thread = None
+        self._next_cleanup = 0
+
+    def wake(self):
+        """Chamado após o commit de um upload para publicar sem esperar pelo poll."""
+        self._wake_event.set()
+
+    def _publish_confirmed(self, rows):
+        """Publica as linhas e devolve os ids confirmados pelo broker."""
+        confirmed = []
+        pending = threading.Semaphore(0)
+
+        def confirm_callback(outbox_id):
+            def on_confirm(ok):
+                if ok:
+                    confirmed.append(outbox_id)
+                pending.release()
+            return on_confirm
+
+        for outbox_id, routing_key, payload in rows:
+            self.publisher.publish(routing_key, json.dumps(payload), on_confirm=confirm_callback(outbox_id))
+
+        deadline = time.time() + OUTBOX_CONFIRM_TIMEOUT
+        for _ in rows:
+            if not pending.acquire(timeout=max(deadline - time.time(), 0)):
+                break
+        return list(confirmed)
+
+    def _lock_pending(self, cur):
+        """Bloqueia o próximo lote por publicar (ignorando os de outros relays)."""
+        cur.execute("""
+            SELECT id, routing_key, payload
+            FROM processing_outbox
+            WHERE published_at IS NULL
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (self.batch_size,))
+        return cur.fetchall()
+
+    def relay_batch(self):
+        """
+        Publica um lote de mensagens pendentes e atualiza as métricas de backlog.
+
+        Sem ligação ao RabbitMQ só as métricas são atualizadas.
+        Devolve o número de mensagens lidas.
+        """
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            rows = []
+            if self.publisher.connected:
+                rows = self._lock_pending(cur)
+
+            if rows:
+                confirmed = self._publish_confirmed(rows)
+                if confirmed:
+                    cur.execute("""
+                        UPDATE processing_outbox
+                        SET published_at = clock_timestamp()
+                        WHERE id = ANY(%s)
+                        RETURNING EXTRACT(EPOCH FROM published_at - created_at)
+                    """, (confirmed,))
+                    for (delivery_seconds,) in cur.fetchall():
+                        OUTBOX_DELIVERY_LAG.observe(float(delivery_seconds))
+                    OUTBOX_RELAYED.inc(len(confirmed))
+                    OUTBOX_BATCH.observe(len(confirmed))
+                if len(confirmed) < len(rows):
+                    OUTBOX_UNCONFIRMED.inc(len(rows) - len(confirmed))
+                    logger.warning(f"Outbox: {len(rows) - len(confirmed)} mensagens sem confirm, ficam para nova tentativa")
+
+            self._update_backlog(cur)
+            conn.commit()
+            cur.close()
+            return len(rows)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            return_db_connection(conn)
+
+    def _update_backlog(self, cur):
+        cur.execute("""
+            SELECT COUNT(*), COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)), 0)
+            FROM processing_outbox
+            WHERE published_at IS NULL
+        """)
+        backlog, lag = cur.fetchone()
+        OUTBOX_BACKLOG.set(backlog)
+        OUTBOX_LAG.set(float(lag))
+
+    def cleanup(self):
+        """Apaga mensagens publicadas há mais de OUTBOX_RETENTION_HOURS."""
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "DELETE FROM processing_outbox WHERE published_at < NOW() - make_interval(hours => %s)",
+                (OUTBOX_RETENTION_HOURS,)
+            )
+            deleted = cur.rowcount
+            conn.commit()
+            cur.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            return_db_connection(conn)
+        if deleted:
+            logger.info(f"Outbox: {deleted} mensagens publicadas removidas")
+
+    def _run(self):
+        delay = 1
+        while True:
+            relayed = 0
+            # Limpar antes do lote: um wake() durante o lote faz a próxima espera terminar logo
+            self._wake_event.clear()
+            try:
+                relayed = self.relay_batch()
+                if time.time() >= self._next_cleanup:
+                    self.cleanup()
+                    self._next_cleanup = time.time() + OUTBOX_CLEANUP_INTERVAL
+                delay = 1
+            except Exception as e:
+                OUTBOX_ERRORS.inc()
+                logger.error(f"Erro no relay da outbox: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+            # Lote cheio: há mais à espera, continuar sem pausa
+            if relayed < self.batch_size:
+                self._wake_event.wait(self.poll_interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='outbox-relay')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
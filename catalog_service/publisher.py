@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Publisher RabbitMQ persistente com publisher confirms - Catalog Service
+
+Uma ligação por processo, mantida por uma thread própria (SelectConnection):
+- publish() só coloca a mensagem numa fila em memória (fora do caminho crítico)
+- A thread publica em rajada até MAX_UNCONFIRMED mensagens por confirmar;
+  o broker confirma-as em lote (Basic.Ack com multiple=True)
+- Nack ou perda da ligação voltam a pôr as mensagens não confirmadas na fila
+  (mensagens com on_confirm não: quem publicou recebe False e decide)
+- Reconexão automática com backoff
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import pika
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Máximo de mensagens publicadas à espera de confirmação
+MAX_UNCONFIRMED = int(os.environ.get('PUBLISHER_MAX_UNCONFIRMED', '256'))
+
+# Backoff máximo entre tentativas de reconexão
+RECONNECT_MAX_DELAY = float(os.environ.get('PUBLISHER_RECONNECT_MAX_DELAY', '30'))
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+PUBLISH_ENQUEUE_TIME = Histogram(
+    'catalog_publish_enqueue_seconds', 'Time spent by request threads handing a message to the publisher',
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05)
+)
+PUBLISH_CONFIRM_TIME = Histogram(
+    'catalog_publish_confirm_seconds', 'Time from publish() to broker confirm',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30)
+)
+PUBLISH_CONFIRM_BATCH = Histogram(
+    'catalog_publish_confirm_batch_size', 'Messages confirmed by a single broker ack',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250)
+)
+PUBLISH_MESSAGES = Counter('catalog_publish_messages_total', 'Published messages by outcome', ['result'])
+PUBLISH_RECONNECTS = Counter('catalog_publish_reconnects_total', 'Publisher connection attempts after a failure')
+PUBLISH_PENDING = Gauge('catalog_publish_pending_messages', 'Messages waiting to be published or confirmed')
+PUBLISH_CONNECTED = Gauge('catalog_publish_connected', 'Whether the publisher channel is open')
+
+OutgoingMessage = namedtuple('OutgoingMessage', ['exchange', 'routing_key', 'body', 'enqueued_at', 'on_confirm'])
+
+class ConfirmedPublisher:
+    """Publisher de longa duração com reconexão e confirms em lote."""
+
+    def __init__(self, parameters, queues=(), exchanges=(), max_unconfirmed=MAX_UNCONFIRMED):
+        self.parameters = parameters
+        self.queues = tuple(queues)
+        # Exchanges fanout declaradas em cada ligação (eventos)
+        self.exchanges = tuple(exchanges)
+        self.max_unconfirmed = max_unconfirmed
+        self._outbox = queue.Queue()
+        # delivery_tag -> OutgoingMessage (só acedido na thread do ioloop)
+        self._unconfirmed = OrderedDict()
+        self._delivery_tag = 0
+        self._connection = None
+        self._channel = None
+        self._ready = False
+        self._thread = None
+
+    # ------------------------------------------------------------
+    # API (chamada pelas threads dos pedidos)
+    # ------------------------------------------------------------
+
+    def publish(self, routing_key, body, on_confirm=None, exchange=''):
+        """
+        Entrega a mensagem à thread do publisher (não bloqueia).
+
+        on_confirm(ok) é chamado na thread do publisher com True quando o
+        broker confirma, ou False em nack/perda da ligação.
+        """
+        start_time = time.time()
+        self._outbox.put(OutgoingMessage(exchange, routing_key, body, start_time, on_confirm))
+        PUBLISH_PENDING.inc()
+        self._wake()
+        PUBLISH_ENQUEUE_TIME.observe(time.time() - start_time)
+        return True
+
+    @property
+    def connected(self):
+        return self._ready
+
+    def stats(self):
+        return {
+            "connected": self._ready,
+            "queued": self._outbox.qsize(),
+            "unconfirmed": len(self._unconfirmed),
+        }
+
+    def _wake(self):
+        connection = self._connection
+        if connection is not None and self._ready:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._drain)
+            except Exception:
+                # Ligação a fechar: as mensagens seguem após a reconexão
+                pass
+
+    # ------------------------------------------------------------
+    # Thread do ioloop
+    # ------------------------------------------------------------
+
+    def _drain(self):
+        """Publica o que estiver na fila até ao limite de não confirmadas."""
+        while self._ready and len(self._unconfirmed) < self.max_unconfirmed:
+            try:
+                message = self._outbox.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._channel.basic_publish(
+                    exchange=message.exchange,
+                    routing_key=message.routing_key,
+                    body=message.body,
+                    properties=pika.BasicProperties(delivery_mode=2)  # Torna a mensagem persistente
+                )
+            except Exception as e:
+                logger.error(f"Erro ao publicar mensagem: {e}")
+                self._outbox.put(message)
+                return
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = message
+
+    def _on_confirm(self, frame):
+        """Basic.Ack/Nack do broker (multiple=True confirma tudo até à tag)."""
+        method = frame.method
+        if method.multiple:
+            tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag] if method.delivery_tag in self._unconfirmed else []
+
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        now = time.time()
+        for tag in tags:
+            message = self._unconfirmed.pop(tag)
+            if acked:
+                PUBLISH_CONFIRM_TIME.observe(now - message.enqueued_at)
+                self._settle(message, True)
+            elif message.on_confirm:
+                self._settle(message, False)
+            else:
+                # Broker recusou: volta para a fila e será republicada
+                self._outbox.put(message)
+        PUBLISH_MESSAGES.labels(result='confirmed' if acked else 'nacked').inc(len(tags))
+        if acked and tags:
+            PUBLISH_CONFIRM_BATCH.observe(len(tags))
+        self._drain()
+
+    def _settle(self, message, ok):
+        PUBLISH_PENDING.dec()
+        if message.on_confirm:
+            try:
+                message.on_confirm(ok)
+            except Exception as e:
+                logger.error(f"Erro no callback de confirmação: {e}")
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        self._declare_exchanges(list(self.exchanges))
+
+    def _declare_exchanges(self, remaining):
+        if remaining:
+            self._channel.exchange_declare(
+                exchange=remaining[0], exchange_type='fanout', durable=True,
+                callback=lambda _frame: self._declare_exchanges(remaining[1:])
+            )
+        else:
+            self._declare_queues(list(self.queues))
+
+    def _declare_queues(self, remaining):
+        if remaining:
+            self._channel.queue_declare(
+                queue=remaining[0], durable=True,
+                callback=lambda _frame: self._declare_queues(remaining[1:])
+            )
+        else:
+            self._channel.confirm_delivery(self._on_confirm, callback=self._on_confirm_mode)
+
+    def _on_confirm_mode(self, _frame):
+        self._delivery_tag = 0
+        self._ready = True
+        PUBLISH_CONNECTED.set(1)
+        logger.info("✅ Publisher RabbitMQ ligado (publisher confirms ativos)")
+        self._drain()
+
+    def _on_channel_closed(self, channel, reason):
+        logger.warning(f"⚠️ Canal do publisher fechado: {reason}")
+        self._ready = False
+        if self._connection and self._connection.is_open:
+            self._connection.close()
+
+    def _on_connection_closed(self, connection, reason):
+        self._ready = False
+        connection.ioloop.stop()
+
+    def _on_connection_error(self, connection, error):
+        logger.error(f"Erro ao conectar publisher ao RabbitMQ: {error!r}")
+        connection.ioloop.stop()
+
+    def _requeue_unconfirmed(self):
+        """Mensagens sem confirm numa ligação perdida são republicadas (at-least-once)."""
+        if self._unconfirmed:
+            logger.warning(f"Republicando {len(self._unconfirmed)} mensagens não confirmadas")
+            PUBLISH_MESSAGES.labels(result='requeued').inc(len(self._unconfirmed))
+        for message in self._unconfirmed.values():
+            if message.on_confirm:
+                self._settle(message, False)
+            else:
+                self._outbox.put(message)
+        self._unconfirmed.clear()
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                self._connection = pika.SelectConnection(
+                    self.parameters,
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_error,
+                    on_close_callback=self._on_connection_closed
+                )
+                self._connection.ioloop.start()
+            except Exception as e:
+                logger.error(f"Erro no publisher RabbitMQ: {e}")
+
+            connected_before = self._delivery_tag > 0 or self._channel is not None
+            self._ready = False
+            self._channel = None
+            PUBLISH_CONNECTED.set(0)
+            self._requeue_unconfirmed()
+            if connected_before:
+                delay = 1
+            PUBLISH_RECONNECTS.inc()
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='rabbitmq-publisher')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Uploads resumíveis (estilo tus) - Catalog Service
+
+Um upload é criado com o tamanho total, recebe os bytes em vários PATCH
+curtos (cada um com o seu Upload-Offset) e só é registado no catálogo e
+enviado para processamento no finalize.
+- Os dados vão para um ficheiro esparso do tamanho final (pwrite no offset)
+- Cada chunk pode trazer Upload-Checksum (sha256/md5/sha1, base64)
+- O estado (intervalos recebidos, dono, metadados) fica num JSON ao lado
+"""
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import base64
+import hashlib
+import logging
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge
+from werkzeug.exceptions import HTTPException, BadRequest, Conflict, NotFound, Forbidden
+
+logger = logging.getLogger(__name__)
+
+# Tamanho das leituras do corpo de cada PATCH
+CHUNK_READ_SIZE = 1024 * 1024
+
+# Uploads não finalizados são apagados ao fim deste tempo sem atividade
+RESUMABLE_UPLOAD_TTL = int(os.environ.get('RESUMABLE_UPLOAD_TTL', str(24 * 3600)))
+
+CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+
+# Reserva de um chunk em curso (um PATCH interrompido sem limpeza liberta-a ao fim deste tempo)
+CHUNK_RESERVATION_TTL = int(os.environ.get('RESUMABLE_CHUNK_RESERVATION_TTL', '3600'))
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+RESUMABLE_CREATED = Counter('catalog_resumable_uploads_created_total', 'Resumable uploads created')
+RESUMABLE_FINALIZED = Counter('catalog_resumable_uploads_finalized_total', 'Resumable uploads finalized')
+RESUMABLE_EXPIRED = Counter('catalog_resumable_uploads_expired_total', 'Resumable uploads expired before finalize')
+RESUMABLE_CHUNKS = Counter('catalog_resumable_chunks_total', 'Resumable upload chunks received', ['result'])
+RESUMABLE_BYTES = Counter('catalog_resumable_chunk_bytes_total', 'Bytes accepted in resumable upload chunks')
+RESUMABLE_ACTIVE = Gauge('catalog_resumable_uploads_active', 'Resumable uploads awaiting finalize')
+
+class ChecksumMismatch(HTTPException):
+    """Código do tus para Upload-Checksum que não confere."""
+    code = 460
+    description = "Checksum do chunk não confere"
+
+def merge_range(ranges, start, end):
+    """Junta [start, end) à lista ordenada de intervalos recebidos."""
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+def contiguous_offset(ranges):
+    """Offset até onde os bytes foram recebidos sem buracos desde 0."""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+def parse_checksum_header(value):
+    """'sha256 <base64>' -> (algoritmo, digest em bytes)."""
+    try:
+        algorithm, encoded = value.strip().split(' ', 1)
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except ValueError:
+        raise BadRequest("Upload-Checksum inválido (esperado '<algoritmo> <base64>')")
+    algorithm = algorithm.lower()
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise BadRequest(f"Algoritmo de checksum não suportado: {algorithm}")
+    return algorithm, digest
+
+class ResumableUploads:
+    """Uploads em curso guardados em <folder>/<id>.part + <id>.json."""
+
+    def __init__(self, folder, ttl=RESUMABLE_UPLOAD_TTL):
+        self.folder = folder
+        self.ttl = ttl
+        os.makedirs(folder, exist_ok=True)
+        self.expire_stale()
+
+    # ------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------
+
+    def data_path(self, upload_id):
+        return os.path.join(self.folder, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id):
+        return os.path.join(self.folder, f"{upload_id}.json")
+
+    def _check_id(self, upload_id):
+        try:
+            return uuid.UUID(hex=upload_id).hex == upload_id
+        except ValueError:
+            return False
+
+    def _read_meta(self, upload_id):
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise NotFound("Upload não encontrado")
+
+    def _write_meta(self, meta):
+        meta['updated_at'] = time.time()
+        path = self._meta_path(meta['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def locked(self, upload_id):
+        """Lock exclusivo (flock) no estado de um upload."""
+        if not self._check_id(upload_id):
+            raise NotFound("Upload não encontrado")
+        with open(os.path.join(self.folder, f"{upload_id}.lock"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, upload_id, user_id):
+        """Estado do upload (só o dono o pode ver)."""
+        if not self._check_id(upload_id):
+            raise NotFound("Upload não encontrado")
+        meta = self._read_meta(upload_id)
+        if meta['user_id'] != user_id:
+            raise Forbidden("Upload pertence a outro utilizador")
+        meta['offset'] = contiguous_offset(meta['ranges'])
+        meta['received'] = sum(end - start for start, end in meta['ranges'])
+        return meta
+
+    # ------------------------------------------------------------
+    # Protocolo
+    # ------------------------------------------------------------
+
+    def create(self, user_id, length, filename, title='', description=''):
+        """Reserva o ficheiro esparso com o tamanho final."""
+        if length is None or length <= 0:
+            raise BadRequest("Upload-Length inválido")
+        self.expire_stale()
+
+        upload_id = uuid.uuid4().hex
+        with open(self.data_path(upload_id), 'wb') as f:
+            f.truncate(length)
+
+        meta = {
+            'id': upload_id,
+            'user_id': user_id,
+            'length': length,
+            'filename': filename,
+            'title': title,
+            'description': description,
+            'ranges': [],
+            'created_at': time.time(),
+        }
+        self._write_meta(meta)
+        RESUMABLE_CREATED.inc()
+        RESUMABLE_ACTIVE.inc()
+        logger.info(f"Upload resumível criado: {upload_id} ({length} bytes)")
+        return meta
+
+    def write_chunk(self, upload_id, user_id, offset, stream, content_length, checksum=None):
+        """
+        Escreve um chunk em [offset, offset + content_length) do ficheiro esparso.
+
+        Os bytes só contam como recebidos depois de o checksum conferir;
+        um chunk rejeitado pode ser reenviado para o mesmo offset.
+
+        O intervalo é reservado sob o lock antes de escrever: dois PATCH
+        sobrepostos não podem ambos passar a verificação, e bytes já
+        verificados nunca são reescritos. A escrita em si corre fora do lock
+        (chunks de intervalos diferentes continuam em paralelo).
+
+        Returns:
+            Estado atualizado (com 'offset').
+        """
+        meta = self.get(upload_id, user_id)
+        if content_length is None:
+            raise BadRequest("Content-Length obrigatório")
+        if offset is None or offset < 0 or offset + content_length > meta['length']:
+            raise Conflict(f"Upload-Offset fora do ficheiro (tamanho {meta['length']})")
+        end = offset + content_length
+        reservation = [offset, end, time.time(), uuid.uuid4().hex]
+
+        with self.locked(upload_id):
+            meta = self._read_meta(upload_id)
+            if any(start < end and offset < range_end for start, range_end in meta['ranges']):
+                # Bytes já verificados não são reescritos (consultar o offset e continuar)
+                raise Conflict(
+                    f"Chunk sobrepõe bytes já recebidos (offset atual {contiguous_offset(meta['ranges'])})"
+                )
+            pending = [p for p in meta.get('pending', []) if p[2] > reservation[2] - CHUNK_RESERVATION_TTL]
+            if any(start < end and offset < range_end for start, range_end, _, _ in pending):
+                raise Conflict("Chunk sobrepõe outro chunk ainda em curso")
+            meta['pending'] = pending + [reservation]
+            self._write_meta(meta)
+
+        verified = False
+        hasher = hashlib.new(checksum[0]) if checksum else None
+        written = 0
+        try:
+            fd = os.open(self.data_path(upload_id), os.O_WRONLY)
+            try:
+                while written < content_length:
+                    data = stream.read(min(CHUNK_READ_SIZE, content_length - written))
+                    if not data:
+                        break
+                    os.pwrite(fd, data, offset + written)
+                    if hasher:
+                        hasher.update(data)
+                    written += len(data)
+            finally:
+                os.close(fd)
+
+            if written != content_length:
+                RESUMABLE_CHUNKS.labels(result='incomplete').inc()
+                raise BadRequest("Chunk incompleto: ligação interrompida")
+            if hasher and hasher.digest() != checksum[1]:
+                RESUMABLE_CHUNKS.labels(result='checksum_mismatch').inc()
+                raise ChecksumMismatch()
+            verified = True
+        finally:
+            # Libertar a reserva e, se o chunk conferiu, registar o intervalo
+            with self.locked(upload_id):
+                meta = self._read_meta(upload_id)
+                meta['pending'] = [p for p in meta.get('pending', []) if p[3] != reservation[3]]
+                if verified and written:
+                    meta['ranges'] = merge_range(meta['ranges'], offset, offset + written)
+                self._write_meta(meta)
+
+        RESUMABLE_CHUNKS.labels(result='ok').inc()
+        RESUMABLE_BYTES.inc(written)
+        return self.get(upload_id, user_id)
+
+    def complete(self, upload_id, user_id):
+        """
+        Verifica que todos os bytes chegaram e calcula o SHA-256 final.
+
+        Returns:
+            (meta, sha256). O ficheiro de dados continua em data_path()
+            até quem chama o mover (ver finish()).
+        """
+        meta = self.get(upload_id, user_id)
+        if meta['offset'] != meta['length']:
+            raise Conflict(f"Upload incompleto: {meta['received']} de {meta['length']} bytes recebidos")
+
+        hasher = hashlib.sha256()
+        with open(self.data_path(upload_id), 'rb') as f:
+            for data in iter(lambda: f.read(CHUNK_READ_SIZE), b''):
+                hasher.update(data)
+        return meta, hasher.hexdigest()
+
+    def finish(self, upload_id):
+        """Apaga o estado de um upload finalizado."""
+        self.discard(upload_id)
+        RESUMABLE_FINALIZED.inc()
+
+    def discard(self, upload_id):
+        for path in (self.data_path(upload_id), self._meta_path(upload_id),
+                     os.path.join(self.folder, f"{upload_id}.lock")):
+            if os.path.exists(path):
+                os.remove(path)
+        RESUMABLE_ACTIVE.dec()
+
+    def expire_stale(self):
+        """Remove uploads sem atividade há mais de ttl segundos."""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            try:
+                meta = self._read_meta(upload_id)
+            except NotFound:
+                continue
+            if meta.get('updated_at', 0) < cutoff:
+                logger.info(f"Upload resumível expirado: {upload_id}")
+                self.discard(upload_id)
+                RESUMABLE_EXPIRED.inc()
+        RESUMABLE_ACTIVE.set(sum(1 for name in os.listdir(self.folder) if name.endswith('.json')))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Índice de sugestões em memória (search-as-you-type) - Catalog Service
+
+GET /suggest?q= responde sem ir à base de dados:
+- Tokens dos títulos normalizados (minúsculas, sem acentos)
+- Para cada prefixo (até SUGGEST_MAX_PREFIX_LEN caracteres) guarda-se já o
+  top-k de vídeos por popularidade (view_count; empate: mais recente), por
+  isso uma sugestão é um acesso a um dicionário
+- Construído a partir da réplica em background no arranque e reconstruído
+  periodicamente (popularidade); uploads entram pelos eventos catalog_events
+"""
+
+import os
+import re
+import time
+import uuid
+import bisect
+import logging
+import threading
+import unicodedata
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from db import get_replica_read_connection, return_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Vídeos guardados por prefixo (o pedido pode pedir até este número)
+SUGGEST_TOP_K = int(os.environ.get('SUGGEST_TOP_K', '32'))
+
+# Prefixos mais longos usam a lista do prefixo com este tamanho, filtrada
+SUGGEST_MAX_PREFIX_LEN = int(os.environ.get('SUGGEST_MAX_PREFIX_LEN', '12'))
+
+# Só os vídeos mais populares entram no índice (limita a memória); uploads entram sempre
+SUGGEST_MAX_VIDEOS = int(os.environ.get('SUGGEST_MAX_VIDEOS', '200000'))
+
+SUGGEST_REBUILD_INTERVAL = float(os.environ.get('SUGGEST_REBUILD_INTERVAL', '600'))
+
+SUGGEST_BUILD_FETCH_SIZE = 5000
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+SUGGEST_VIDEOS = Gauge('catalog_suggest_index_videos', 'Videos in the suggestion index')
+SUGGEST_PREFIXES = Gauge('catalog_suggest_index_prefixes', 'Prefixes in the suggestion index')
+SUGGEST_BUILD_TIME = Gauge('catalog_suggest_index_build_seconds', 'Duration of the last suggestion index build')
+SUGGEST_BUILD_ERRORS = Counter('catalog_suggest_index_build_errors_total', 'Failed suggestion index builds')
+SUGGEST_PARTIAL = Counter('catalog_suggest_partial_lookups_total', 'Filtered lookups that may have missed matches outside the top-k')
+SUGGEST_LOOKUP_TIME = Histogram(
+    'catalog_suggest_lookup_seconds', 'Suggestion index lookup time',
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+def normalize_tokens(text):
+    """'Canção do Mar' -> ['cancao', 'do', 'mar']."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    stripped = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return TOKEN_PATTERN.findall(stripped)
+
+def title_prefixes(title, max_len=SUGGEST_MAX_PREFIX_LEN):
+    """Todos os prefixos dos tokens do título (sem repetidos)."""
+    prefixes = set()
+    for token in normalize_tokens(title):
+        for end in range(1, min(len(token), max_len) + 1):
+            prefixes.add(token[:end])
+    return prefixes
+
+class SuggestIndex:
+    """
+    prefixo -> lista ordenada (no máximo SUGGEST_TOP_K) de entradas
+    (-popularidade, -id); a mesma tupla de cada vídeo é partilhada por
+    todos os seus prefixos.
+    """
+
+    def __init__(self, top_k=SUGGEST_TOP_K, max_prefix_len=SUGGEST_MAX_PREFIX_LEN,
+                 max_videos=SUGGEST_MAX_VIDEOS):
+        self.top_k = top_k
+        self.max_prefix_len = max_prefix_len
+        self.max_videos = max_videos
+        self._completions = {}
+        self._titles = {}
+        self._lock = threading.Lock()
+        # Uploads que chegam durante uma reconstrução (reaplicados no fim)
+        self._pending = None
+        self.ready = False
+        self.built_at = None
+        self._thread = None
+
+    def _insert(self, completions, titles, video_id, title, weight):
+        if video_id in titles or not title:
+            return
+        titles[video_id] = title
+        entry = (-weight, -video_id)
+        for prefix in title_prefixes(title, self.max_prefix_len):
+            entries = completions.get(prefix)
+            if entries is None:
+                completions[prefix] = [entry]
+            elif len(entries) < self.top_k or entry < entries[-1]:
+                bisect.insort(entries, entry)
+                if len(entries) > self.top_k:
+                    entries.pop()
+
+    def add(self, video_id, title, weight=0):
+        """Novo vídeo (upload); repetir o mesmo id não tem efeito."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((video_id, title, weight))
+            self._insert(self._completions, self._titles, video_id, title, weight)
+            SUGGEST_VIDEOS.set(len(self._titles))
+
+    def on_catalog_event(self, event):
+        """Subscritor de catalog_events: eventos de upload trazem id e título."""
+        for video in event.get('videos') or []:
+            self.add(video['id'], video['title'])
+
+    def lookup(self, text, k):
+        """
+        Top-k vídeos cujo título tem um token a começar pelo último termo
+        (e contém os termos anteriores completos).
+
+        Returns:
+            (sugestões, completo). Com vários termos (ou prefixos maiores que
+            max_prefix_len) só a lista top-K do prefixo é filtrada; se sobrarem
+            menos de k e essa lista estiver cheia, pode haver títulos fora
+            dela que também servem (completo=False: quem chama deve ir à
+            base de dados).
+        """
+        start_time = time.perf_counter()
+        terms = normalize_tokens(text)
+        if not terms:
+            return [], True
+        last, previous = terms[-1], terms[:-1]
+        with self._lock:
+            entries = list(self._completions.get(last[:self.max_prefix_len], ()))
+            titles = self._titles
+
+        filtered = bool(previous) or len(last) > self.max_prefix_len
+        suggestions = []
+        for _, negative_id in entries:
+            video_id = -negative_id
+            title = titles[video_id]
+            if filtered:
+                tokens = normalize_tokens(title)
+                if not all(term in tokens for term in previous):
+                    continue
+                if not any(token.startswith(last) for token in tokens):
+                    continue
+            suggestions.append({"id": video_id, "title": title})
+            if len(suggestions) >= k:
+                break
+        SUGGEST_LOOKUP_TIME.observe(time.perf_counter() - start_time)
+        # Uma lista com menos de top_k entradas nunca perdeu vídeos (tem todos os do prefixo)
+        complete = not filtered or len(suggestions) >= k or len(entries) < self.top_k
+        if not complete:
+            SUGGEST_PARTIAL.inc()
+        return suggestions, complete
+
+    def build(self):
+        """(Re)constrói o índice a partir da réplica e troca-o de uma só vez."""
+        start_time = time.time()
+        with self._lock:
+            self._pending = []
+        completions, titles = {}, {}
+        try:
+            conn = get_replica_read_connection()
+            try:
+                cur = conn.cursor(name=f"suggest_{uuid.uuid4().hex}")
+                cur.itersize = SUGGEST_BUILD_FETCH_SIZE
+                # Por popularidade: as listas enchem cedo e o resto quase não as toca
+                cur.execute(
+                    "SELECT id, title, COALESCE(view_count, 0) FROM videos ORDER BY view_count DESC NULLS LAST, id DESC LIMIT %s",
+                    (self.max_videos,)
+                )
+                for video_id, title, weight in cur:
+                    self._insert(completions, titles, video_id, title, weight)
+                cur.close()
+            finally:
+                conn.rollback()
+                return_db_connection(conn)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            for video_id, title, weight in self._pending:
+                self._insert(completions, titles, video_id, title, weight)
+            self._pending = None
+            self._completions, self._titles = completions, titles
+            self.ready = True
+            self.built_at = time.time()
+        SUGGEST_VIDEOS.set(len(titles))
+        SUGGEST_PREFIXES.set(len(completions))
+        SUGGEST_BUILD_TIME.set(time.time() - start_time)
+        logger.info(f"✅ Índice de sugestões: {len(titles)} vídeos, {len(completions)} prefixos "
+                    f"({time.time() - start_time:.1f}s)")
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "videos": len(self._titles),
+            "prefixes": len(self._completions),
+            "built_at": self.built_at,
+        }
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                self.build()
+                delay = SUGGEST_REBUILD_INTERVAL
+            except Exception as e:
+                SUGGEST_BUILD_ERRORS.inc()
+                logger.error(f"Erro ao construir o índice de sugestões: {e}")
+                delay = min(delay * 2, 60) if not self.ready else SUGGEST_REBUILD_INTERVAL
+            time.sleep(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='suggest-index')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Cache local de validação de tokens - Catalog Service
+
+Evita um POST /validate ao authentication_service por pedido:
+- TTL + LRU em memória, chave = SHA-256 do token (o token não fica guardado)
+- Cache negativa (curta) para tokens inválidos
+- Invalidação por eventos de logout (exchange fanout auth_events no RabbitMQ)
+- Sem ligação aos eventos a cache fica desligada (um logout perdido deixaria
+  o token válido até ao fim do TTL): todas as validações vão ao auth service
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import pika
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', '60'))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.environ.get('TOKEN_CACHE_NEGATIVE_TTL', '10'))
+
+AUTH_EVENTS_EXCHANGE = 'auth_events'
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+TOKEN_CACHE_LOOKUPS = Counter('catalog_token_cache_lookups_total', 'Token cache lookups', ['result'])
+TOKEN_CACHE_INVALIDATIONS = Counter('catalog_token_cache_invalidations_total', 'Tokens invalidated by auth events')
+TOKEN_CACHE_ENTRIES = Gauge('catalog_token_cache_entries', 'Entries in the token cache')
+TOKEN_CACHE_ENABLED = Gauge('catalog_token_cache_enabled', 'Whether the token cache is receiving logout events')
+
+def token_key(token):
+    """Chave da cache (e dos eventos de logout): SHA-256 do token."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+class TokenCache:
+    """Cache TTL + LRU de token -> utilizador (None = token inválido)."""
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL,
+                 negative_ttl=TOKEN_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # chave -> (user, expires_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Só ligada enquanto o listener recebe eventos de logout
+        self.enabled = False
+
+    def lookup(self, token):
+        """
+        Procura o token na cache.
+
+        Returns:
+            (found, user). user é None para tokens em cache negativa.
+        """
+        key = token_key(token)
+        now = time.time()
+        with self._lock:
+            if not self.enabled:
+                TOKEN_CACHE_LOOKUPS.labels(result='bypass').inc()
+                return False, None
+            entry = self._entries.get(key)
+            if entry is None:
+                TOKEN_CACHE_LOOKUPS.labels(result='miss').inc()
+                return False, None
+            user, expires_at = entry
+            if expires_at <= now:
+                TOKEN_CACHE_LOOKUPS.labels(result='expired').inc()
+                return False, None
+            self._entries.move_to_end(key)
+        TOKEN_CACHE_LOOKUPS.labels(result='hit' if user is not None else 'negative_hit').inc()
+        return True, user
+
+    def store(self, token, user, expires_in=None):
+        """Guarda o resultado da validação (user=None para cache negativa)."""
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if expires_in is not None:
+            ttl = min(ttl, expires_in)
+        with self._lock:
+            if not self.enabled:
+                return
+            key = token_key(token)
+            self._entries[key] = (user, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            TOKEN_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate_key(self, key):
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+            TOKEN_CACHE_ENTRIES.set(len(self._entries))
+        TOKEN_CACHE_INVALIDATIONS.inc()
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            TOKEN_CACHE_ENTRIES.set(0)
+
+    def enable(self):
+        """Ligação aos eventos (re)estabelecida: começar vazia e ligada."""
+        with self._lock:
+            self._entries.clear()
+            self.enabled = True
+            TOKEN_CACHE_ENTRIES.set(0)
+        TOKEN_CACHE_ENABLED.set(1)
+
+    def disable(self):
+        """Sem eventos de logout não há invalidação: deixar de servir da cache."""
+        with self._lock:
+            self.enabled = False
+            self._entries.clear()
+            TOKEN_CACHE_ENTRIES.set(0)
+        TOKEN_CACHE_ENABLED.set(0)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+        }
+
+class TokenInvalidationListener:
+    """Consome eventos de logout do auth service e invalida a cache."""
+
+    def __init__(self, cache, parameters):
+        self.cache = cache
+        self.parameters = parameters
+        self._thread = None
+
+    def _on_event(self, channel, method, properties, body):
+        try:
+            event = json.loads(body)
+            if event.get('event') == 'logout' and event.get('token_hash'):
+                self.cache.invalidate_key(event['token_hash'])
+        except ValueError:
+            logger.warning("Evento de autenticação inválido ignorado")
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                connection = pika.BlockingConnection(self.parameters)
+                channel = connection.channel()
+                channel.exchange_declare(exchange=AUTH_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+                # Fila exclusiva por processo: cada instância recebe todos os eventos
+                result = channel.queue_declare(queue='', exclusive=True)
+                channel.queue_bind(exchange=AUTH_EVENTS_EXCHANGE, queue=result.method.queue)
+                channel.basic_consume(queue=result.method.queue, on_message_callback=self._on_event, auto_ack=True)
+
+                # Eventos perdidos enquanto estávamos desligados: começar com a cache vazia
+                self.cache.enable()
+                delay = 1
+                logger.info("✅ A escutar eventos de logout para a cache de tokens")
+                channel.start_consuming()
+            except Exception as e:
+                logger.warning(f"⚠️ Ligação de eventos de autenticação perdida: {e!r}")
+            self.cache.disable()
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='token-invalidation')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Parser multipart em streaming - Catalog Service
+
+Lê o corpo do pedido diretamente de request.stream (sem o spool do
+werkzeug num ficheiro temporário) e escreve a parte do ficheiro na pasta
+de destino em escritas grandes, calculando tamanho e SHA-256 à medida.
+- Campos de texto ficam em memória (limitados a MAX_FIELD_SIZE)
+- O ficheiro fica num temporário oculto na pasta final, pronto para os.replace
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import logging
+from collections import namedtuple
+
+from prometheus_client import Counter, Histogram
+from werkzeug.exceptions import BadRequest
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+
+logger = logging.getLogger(__name__)
+
+# Tamanho das leituras do socket e das escritas em disco
+UPLOAD_READ_SIZE = int(os.environ.get('UPLOAD_READ_SIZE', str(256 * 1024)))
+UPLOAD_WRITE_BUFFER = int(os.environ.get('UPLOAD_WRITE_BUFFER', str(8 * 1024 * 1024)))
+
+# Limite para os campos de texto (title, description, ...)
+MAX_FIELD_SIZE = 1024 * 1024
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+UPLOAD_RECEIVED_BYTES = Counter('catalog_upload_received_bytes_total', 'Request body bytes read from upload requests')
+UPLOAD_FILE_BYTES = Counter('catalog_upload_file_bytes_total', 'Uploaded file payload bytes')
+UPLOAD_DISK_BYTES = Counter('catalog_upload_disk_written_bytes_total', 'Bytes written to disk by the upload path')
+UPLOAD_DISK_WRITES = Counter('catalog_upload_disk_writes_total', 'write() calls issued by the upload path')
+UPLOAD_TIME = Histogram(
+    'catalog_upload_seconds', 'Time spent receiving and storing an upload',
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+UPLOAD_THROUGHPUT = Histogram(
+    'catalog_upload_throughput_bytes_per_second', 'Upload throughput (file bytes / receive time)',
+    buckets=(1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8, 5e8, 1e9)
+)
+
+StreamedFile = namedtuple('StreamedFile', ['field', 'filename', 'tmp_path', 'size', 'sha256'])
+
+class BufferedHashWriter:
+    """Escreve em blocos de UPLOAD_WRITE_BUFFER e calcula o SHA-256 à medida."""
+
+    def __init__(self, path, buffer_size=UPLOAD_WRITE_BUFFER):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self._buffer = bytearray()
+        # Sem buffer do Python: o nosso buffer já garante escritas grandes
+        self._file = open(path, 'wb', buffering=0)
+
+    def write(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        self._buffer += data
+        if len(self._buffer) >= self.buffer_size:
+            self._flush()
+
+    def _flush(self):
+        view = memoryview(self._buffer)
+        while view:
+            written = self._file.write(view)
+            UPLOAD_DISK_WRITES.inc()
+            UPLOAD_DISK_BYTES.inc(written)
+            view = view[written:]
+        view.release()
+        self._buffer.clear()
+
+    def close(self):
+        if not self._file.closed:
+            self._flush()
+            self._file.close()
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def parse_streaming_upload(stream, boundary, folder, file_field='file'):
+    """
+    Consome um corpo multipart/form-data em streaming.
+
+    A parte `file_field` é escrita num temporário oculto dentro de `folder`
+    (o mesmo sistema de ficheiros do destino, para o os.replace ser atómico);
+    outras partes de ficheiro são descartadas.
+
+    Returns:
+        (fields, StreamedFile ou None). Quem chama é responsável por mover
+        ou remover StreamedFile.tmp_path.
+    """
+    if not boundary:
+        raise BadRequest("Pedido multipart sem boundary")
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'), MAX_FIELD_SIZE)
+    fields = {}
+    upload = None
+    writer = None
+    current = None
+    field_data = bytearray()
+    received = 0
+    start_time = time.time()
+
+    try:
+        complete = False
+        while not complete:
+            chunk = stream.read(UPLOAD_READ_SIZE)
+            received += len(chunk)
+            decoder.receive_data(chunk or None)
+
+            while True:
+                event = decoder.next_event()
+                if isinstance(event, NeedData):
+                    if not chunk:
+                        raise BadRequest("Corpo multipart incompleto")
+                    break
+                if isinstance(event, Epilogue):
+                    complete = True
+                    break
+
+                if isinstance(event, (Field, File)):
+                    current = event
+                    field_data.clear()
+                    if isinstance(event, File) and event.name == file_field and writer is None:
+                        tmp_path = os.path.join(folder, f".upload-{uuid.uuid4().hex}.part")
+                        writer = BufferedHashWriter(tmp_path)
+                elif isinstance(event, Data):
+                    if isinstance(current, File):
+                        if writer and upload is None and current.name == file_field:
+                            writer.write(event.data)
+                            if not event.more_data:
+                                writer.close()
+                                upload = StreamedFile(file_field, current.filename, writer.path,
+                                                      writer.size, writer.hasher.hexdigest())
+                    else:
+                        field_data += event.data
+                        if not event.more_data:
+                            fields[current.name] = field_data.decode('utf-8', 'replace')
+    except Exception as e:
+        if writer:
+            writer.abort()
+        if isinstance(e, ValueError):
+            # Erros de sintaxe do MultipartDecoder
+            raise BadRequest(f"Corpo multipart inválido: {e}")
+        raise
+    finally:
+        UPLOAD_RECEIVED_BYTES.inc(received)
+
+    if upload:
+        elapsed = time.time() - start_time
+        UPLOAD_FILE_BYTES.inc(upload.size)
+        UPLOAD_TIME.observe(elapsed)
+        if elapsed > 0:
+            UPLOAD_THROUGHPUT.observe(upload.size / elapsed)
+        logger.info(f"Upload recebido em streaming: {upload.size / (1024*1024):.2f} MB em {elapsed:.2f}s")
+    return fields, upload
@@ -1,5 +1,9 @@
 -- UALFlix Database Initialization - PASSWORD HASH CORRIGIDO
 -- Script SQL com passwords hash mais pequenos
+--
+-- Idempotente: para atualizar uma base de dados já existente (volume
+-- db_master_data criado antes das colunas/índices novos), correr outra vez:
+--   docker compose exec ualflix_db_master psql -U postgres -d ualflix -f /docker-entrypoint-initdb.d/01-init.sql
 
 -- Create users table com password hash maior
 CREATE TABLE IF NOT EXISTS users (
@@ -25,9 +29,34 @@ CREATE TABLE IF NOT EXISTS videos (
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     view_count INTEGER DEFAULT 0,
     status VARCHAR(20) DEFAULT 'active',
-    user_id INTEGER REFERENCES users(id)
+    user_id INTEGER REFERENCES users(id),
+    content_hash VARCHAR(64),  -- SHA-256 do conteúdo (deduplicação de uploads)
+    -- Pesquisa full-text: título (peso A) e descrição (peso B); 'simple' para o prefixo funcionar sem stemming
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
 );
 
+-- Bases de dados criadas antes da deduplicação de uploads
+ALTER TABLE videos ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+-- Lookup de blobs já existentes por conteúdo
+CREATE INDEX IF NOT EXISTS idx_videos_content_hash ON videos(content_hash);
+
+-- Paginação por keyset (upload_date, id): listagem geral e por utilizador
+CREATE INDEX IF NOT EXISTS idx_videos_upload_date_id ON videos(upload_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_videos_user_upload_date_id ON videos(user_id, upload_date DESC, id DESC);
+
+-- Bases de dados criadas antes da pesquisa (reescreve a tabela uma vez para preencher a coluna)
+ALTER TABLE videos ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+) STORED;
+
+-- GET /search: termos e prefixos (to_tsquery ... :*) sobre search_vector
+CREATE INDEX IF NOT EXISTS idx_videos_search ON videos USING GIN (search_vector);
+
 -- Create video_views table
 CREATE TABLE IF NOT EXISTS video_views (
     id SERIAL PRIMARY KEY,
@@ -44,3 +73,16 @@ CREATE TABLE IF NOT EXISTS replication_test (
     test_data TEXT
 );
 
+
+-- Outbox do upload -> processamento (escrita na mesma transação do vídeo)
+CREATE TABLE IF NOT EXISTS processing_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    video_id INTEGER REFERENCES videos(id) ON DELETE CASCADE,
+    routing_key VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    published_at TIMESTAMP
+);
+
+-- O relay só lê mensagens por publicar
+CREATE INDEX IF NOT EXISTS idx_processing_outbox_pending ON processing_outbox(id) WHERE published_at IS NULL;
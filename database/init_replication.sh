@@ -0,0 +1,18 @@
+#!/bin/bash
+# database/init_replication.sh
+# Permite que as réplicas (pg_basebackup + streaming) se liguem ao master:
+# só o role replica_user, com password e só a partir da rede do compose
+
+set -e
+
+REPLICATION_USER="${REPLICATION_USER:-replica_user}"
+REPLICATION_PASSWORD="${REPLICATION_PASSWORD:-replica_password}"
+REPLICATION_SUBNET="${REPLICATION_SUBNET:-172.20.0.0/16}"
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" \
+    -v repl_user="$REPLICATION_USER" -v password="$REPLICATION_PASSWORD" <<-'EOSQL'
+    SET password_encryption = 'md5';
+    CREATE ROLE :"repl_user" WITH REPLICATION LOGIN PASSWORD :'password';
+EOSQL
+
+echo "host    replication     $REPLICATION_USER    $REPLICATION_SUBNET    md5" >> "$PGDATA/pg_hba.conf"
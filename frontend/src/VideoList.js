@@ -12,6 +12,8 @@ function VideoList({
   const [loading, setLoading] = useState(propLoading || true);
   const [error, setError] = useState(propError || null);
   const [selectedVideo, setSelectedVideo] = useState(null);
+  const [query, setQuery] = useState("");
+  const [searchResults, setSearchResults] = useState(null);
 
   useEffect(() => {
     if (propVideos) setVideos(propVideos);
@@ -45,6 +47,27 @@ function VideoList({
     }
   }, []);
 
+  // Pesquisa no servidor (GET /search) enquanto se escreve
+  useEffect(() => {
+    if (!query.trim()) {
+      setSearchResults(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await api.get("/search", { params: { q: query } });
+        if (!cancelled) setSearchResults(response.data.videos);
+      } catch (error) {
+        console.error("Erro na pesquisa:", error);
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [query]);
+
   const handleVideoSelect = (video) => {
     setSelectedVideo(video);
   };
@@ -73,22 +96,33 @@ function VideoList({
     );
   }
 
+  const shownVideos = searchResults !== null ? searchResults : videos;
+
   return (
     <div className="video-list-container">
       <div className="video-list-header">
         <h2>Vídeos Disponíveis</h2>
+        <input
+          type="search"
+          className="search-input"
+          placeholder="Pesquisar vídeos..."
+          value={query}
+          onChange={(e) => setQuery(e.target.value)}
+        />
         <button onClick={fetchVideos} className="refresh-btn">
           <span className="refresh-icon">↻</span> Atualizar
         </button>
       </div>
 
-      {videos.length === 0 ? (
+      {shownVideos.length === 0 ? (
         <p className="no-videos">
-          Nenhum vídeo disponível. Faça upload do seu primeiro vídeo!
+          {searchResults !== null
+            ? `Nenhum vídeo encontrado para "${query}".`
+            : "Nenhum vídeo disponível. Faça upload do seu primeiro vídeo!"}
         </p>
       ) : (
         <div className="video-grid">
-          {videos.map((video) => (
+          {shownVideos.map((video) => (
             <div
               key={video.id}
               className="video-card"
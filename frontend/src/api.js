@@ -14,6 +14,12 @@ api.interceptors.request.use(
     if (token) {
       config.headers['X-Session-Token'] = token;
     }
+
+    // Read-your-writes: leituras só em réplicas que já aplicaram o último upload
+    const minLsn = sessionStorage.getItem('minLsn');
+    if (minLsn && (config.method || 'get') === 'get') {
+      config.headers['X-Min-LSN'] = minLsn;
+    }
     
     // Para uploads, aumentar o timeout
     if (config.data instanceof FormData) {
@@ -30,6 +36,10 @@ api.interceptors.request.use(
 // Interceptor para lidar com respostas de erro de autenticação
 api.interceptors.response.use(
   (response) => {
+    // O /upload devolve o LSN do commit
+    if (response.data && response.data.lsn) {
+      sessionStorage.setItem('minLsn', response.data.lsn);
+    }
     return response;
   },
   (error) => {
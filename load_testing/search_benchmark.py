@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Benchmark da pesquisa (GET /api/search) num catálogo sintético.
+
+1. --seed 1000000 insere vídeos sintéticos (vocabulário com distribuição Zipf,
+   como títulos reais: poucas palavras muito comuns, muitas raras)
+2. Pedidos concorrentes de pesquisa: palavra, duas palavras e prefixo
+   (type-ahead); relatório de p50/p95/p99 por tipo
+3. --explain mostra o plano (deve usar idx_videos_search)
+4. --cleanup apaga os vídeos sintéticos
+"""
+import io
+import os
+import sys
+import time
+import json
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import requests
+
+BASE_URL = "http://localhost"
+SEARCH_ENDPOINT = "/api/search"
+
+DEFAULT_REQUESTS = 2000
+DEFAULT_CONCURRENCY = 16
+DEFAULT_VOCABULARY = 20000
+
+# Vídeos sintéticos são marcados pelo filename (para o --cleanup)
+SYNTHETIC_PREFIX = "bench-search-"
+SEED_BATCH = 50000
+
+COMMON_WORDS = [
+    "video", "tutorial", "aula", "musica", "concerto", "futebol", "golo", "jogo",
+    "receita", "cozinha", "viagem", "lisboa", "porto", "praia", "montanha", "gato",
+    "cao", "natureza", "documentario", "entrevista", "podcast", "ciencia", "historia",
+    "programacao", "python", "javascript", "docker", "kubernetes", "review", "unboxing",
+    "trailer", "filme", "serie", "episodio", "noticias", "desporto", "treino", "yoga",
+    "danca", "guitarra", "piano", "arte", "pintura", "fotografia", "drone", "carro",
+    "mota", "bicicleta", "corrida", "maratona", "comedia", "humor", "animacao", "jogos",
+]
+
+SYLLABLES = ["ba", "be", "ca", "co", "da", "de", "fa", "ga", "la", "li", "ma", "mo",
+             "na", "ne", "pa", "po", "ra", "ri", "sa", "so", "ta", "te", "va", "vi", "xa", "zu"]
+
+def db_config(args):
+    return {
+        'host': args.db_host,
+        'port': args.db_port,
+        'database': args.db_name,
+        'user': args.db_user,
+        'password': args.db_password,
+    }
+
+def build_vocabulary(size, rng):
+    """Palavras comuns primeiro (mais frequentes), depois palavras inventadas."""
+    words = list(COMMON_WORDS)
+    seen = set(words)
+    while len(words) < size:
+        word = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    # Zipf: a palavra de ordem k aparece com peso 1/k
+    cum_weights = []
+    total = 0.0
+    for rank in range(1, len(words) + 1):
+        total += 1.0 / rank
+        cum_weights.append(total)
+    return words, cum_weights
+
+def random_text(rng, words, cum_weights, min_words, max_words):
+    return ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(min_words, max_words)))
+
+def seed_catalog(config, rows, vocabulary, seed):
+    """Insere vídeos sintéticos com COPY, em lotes."""
+    rng = random.Random(seed)
+    words, cum_weights = build_vocabulary(vocabulary, rng)
+    conn = psycopg2.connect(**config)
+    cursor = conn.cursor()
+    start_time = time.time()
+    inserted = 0
+
+    while inserted < rows:
+        batch = min(SEED_BATCH, rows - inserted)
+        buffer = io.StringIO()
+        for i in range(batch):
+            title = random_text(rng, words, cum_weights, 2, 6)
+            description = random_text(rng, words, cum_weights, 5, 30)
+            buffer.write(f"{title}\t{description}\t{SYNTHETIC_PREFIX}{inserted + i}.mp4\tactive\n")
+        buffer.seek(0)
+        cursor.copy_expert(
+            "COPY videos (title, description, filename, status) FROM STDIN", buffer
+        )
+        conn.commit()
+        inserted += batch
+        print(f"  {inserted}/{rows} vídeos inseridos ({time.time() - start_time:.1f}s)")
+
+    print("ANALYZE videos...")
+    cursor.execute("ANALYZE videos")
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"Catálogo sintético criado em {time.time() - start_time:.1f}s")
+
+def cleanup_catalog(config):
+    conn = psycopg2.connect(**config)
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM videos WHERE filename LIKE %s", (f"{SYNTHETIC_PREFIX}%",))
+    print(f"{cursor.rowcount} vídeos sintéticos removidos")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def build_queries(count, vocabulary, seed):
+    """(tipo, texto): palavras comuns, raras, pares e prefixos de 2-4 letras."""
+    rng = random.Random(seed + 1)
+    words, cum_weights = build_vocabulary(vocabulary, random.Random(seed))
+    queries = []
+    for _ in range(count):
+        kind = rng.choice(["word", "rare_word", "two_words", "prefix"])
+        if kind == "word":
+            text = rng.choices(words, cum_weights=cum_weights)[0] + ' '
+        elif kind == "rare_word":
+            text = rng.choice(words[len(words) // 2:]) + ' '
+        elif kind == "two_words":
+            text = random_text(rng, words, cum_weights, 2, 2) + ' '
+        else:
+            word = rng.choices(words, cum_weights=cum_weights)[0]
+            text = word[:rng.randint(2, min(4, len(word)))]
+        queries.append((kind, text))
+    return queries
+
+def timed_search(session, url, kind, text, limit):
+    start_time = time.time()
+    try:
+        response = session.get(url, params={"q": text, "limit": limit}, timeout=30)
+        success = response.status_code == 200
+        results = len(response.json().get("videos", [])) if success else 0
+        status_code = response.status_code
+    except Exception:
+        success, results, status_code = False, 0, 0
+    return {
+        "kind": kind,
+        "query": text,
+        "status_code": status_code,
+        "success": success,
+        "results": results,
+        "response_time": time.time() - start_time,
+    }
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def run_benchmark(url, queries, concurrency, limit):
+    print(f"A executar {len(queries)} pesquisas com concorrência {concurrency}...")
+    session = requests.Session()
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=concurrency))
+    start_time = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda q: timed_search(session, url, q[0], q[1], limit), queries))
+    elapsed = time.time() - start_time
+    print(f"Concluído em {elapsed:.1f}s ({len(queries) / elapsed:.0f} pesquisas/s)")
+    return results
+
+def analyze_results(results):
+    groups = {"total": results}
+    for r in results:
+        groups.setdefault(r["kind"], []).append(r)
+
+    summary = {}
+    print("\n===== LATÊNCIA DA PESQUISA =====")
+    print(f"{'tipo':<12}{'pedidos':>9}{'erros':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for kind, items in groups.items():
+        times = [r["response_time"] * 1000 for r in items if r["success"]]
+        errors = len(items) - len(times)
+        if not times:
+            print(f"{kind:<12}{len(items):>9}{errors:>7}")
+            continue
+        summary[kind] = {
+            "requests": len(items),
+            "errors": errors,
+            "p50_ms": percentile(times, 0.50),
+            "p95_ms": percentile(times, 0.95),
+            "p99_ms": percentile(times, 0.99),
+            "max_ms": max(times),
+        }
+        s = summary[kind]
+        print(f"{kind:<12}{len(items):>9}{errors:>7}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}")
+
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    filename = f"search_benchmark_results_{timestamp}.json"
+    with open(filename, 'w') as f:
+        json.dump({"summary": summary, "raw_results": results}, f, indent=2)
+    print(f"\nResultados detalhados salvos em: {filename}")
+
+def explain(config, queries, candidates):
+    """EXPLAIN ANALYZE da query do /search para alguns exemplos."""
+    conn = psycopg2.connect(**config)
+    cursor = conn.cursor()
+    for kind, text in queries:
+        terms = [t for t in text.lower().split() if t]
+        tsquery = ' & '.join(terms) + ('' if text.endswith(' ') else ':*')
+        # Mesma forma da query de search_videos (catalog_service/app.py)
+        cursor.execute("""
+            EXPLAIN (ANALYZE, BUFFERS)
+            WITH candidates AS MATERIALIZED (
+                SELECT id, search_vector
+                FROM videos
+                WHERE search_vector @@ to_tsquery('simple', %s)
+                ORDER BY id DESC
+                LIMIT %s
+            )
+            SELECT c.id, ts_rank_cd(c.search_vector, query)::float8 AS rank
+            FROM candidates c CROSS JOIN to_tsquery('simple', %s) AS query
+            ORDER BY rank DESC, c.id DESC
+            LIMIT 21
+        """, (tsquery, candidates, tsquery))
+        print(f"\n--- {kind}: {tsquery}")
+        for (line,) in cursor.fetchall():
+            print(line)
+    cursor.close()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da pesquisa full-text do UALFlix.')
+    parser.add_argument('--base-url', default=BASE_URL, help=f'URL base (padrão: {BASE_URL})')
+    parser.add_argument('--endpoint', default=SEARCH_ENDPOINT,
+                        help=f'Caminho da pesquisa (padrão: {SEARCH_ENDPOINT}; /search direto no catalog_service)')
+    parser.add_argument('--seed', type=int, default=0, metavar='ROWS',
+                        help='Inserir ROWS vídeos sintéticos antes do teste (ex.: 1000000)')
+    parser.add_argument('--cleanup', action='store_true', help='Apagar os vídeos sintéticos e sair')
+    parser.add_argument('--explain', action='store_true', help='Mostrar o plano de algumas pesquisas')
+    parser.add_argument('-n', '--requests', type=int, default=DEFAULT_REQUESTS,
+                        help=f'Número de pesquisas (padrão: {DEFAULT_REQUESTS})')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Pesquisas em simultâneo (padrão: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--limit', type=int, default=20, help='Resultados por página (padrão: 20)')
+    parser.add_argument('--vocabulary', type=int, default=DEFAULT_VOCABULARY,
+                        help=f'Palavras distintas no catálogo sintético (padrão: {DEFAULT_VOCABULARY})')
+    parser.add_argument('--candidates', type=int, default=5000,
+                        help='SEARCH_MAX_CANDIDATES do catalog_service, para o --explain (padrão: 5000)')
+    parser.add_argument('--random-seed', type=int, default=42)
+    parser.add_argument('--db-host', default=os.environ.get('DB_MASTER_HOST', 'localhost'))
+    parser.add_argument('--db-port', type=int, default=int(os.environ.get('DB_MASTER_PORT', '5432')))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'ualflix'))
+    parser.add_argument('--db-user', default=os.environ.get('DB_USER', 'postgres'))
+    parser.add_argument('--db-password', default=os.environ.get('DB_PASSWORD', 'password'))
+
+    args = parser.parse_args()
+    config = db_config(args)
+
+    if args.cleanup:
+        cleanup_catalog(config)
+        return
+
+    if args.seed:
+        print(f"A criar catálogo sintético com {args.seed} vídeos...")
+        seed_catalog(config, args.seed, args.vocabulary, args.random_seed)
+
+    queries = build_queries(args.requests, args.vocabulary, args.random_seed)
+
+    if args.explain:
+        explain(config, queries[:4], args.candidates)
+
+    url = f"{args.base_url}{args.endpoint}"
+    results = run_benchmark(url, queries, args.concurrency, args.limit)
+    if not any(r["success"] for r in results):
+        print(f"Nenhuma pesquisa com sucesso; o serviço está acessível em {url}?")
+        sys.exit(1)
+    analyze_results(results)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 from flask import Flask, send_from_directory, jsonify, request, Response
 from flask_cors import CORS
 from prometheus_flask_exporter import PrometheusMetrics
+from werkzeug.http import http_date, parse_date
+from video_index import VideoIndex, make_etag
 import os
+import re
+import uuid
 import logging
-import mimetypes
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -23,96 +26,347 @@ except Exception as e:
 VIDEO_FOLDER = '/videos'
 os.makedirs(VIDEO_FOLDER, exist_ok=True)
 
+# Índice em memória (inotify + rescan periódico) da pasta de vídeos
+video_index = VideoIndex(VIDEO_FOLDER).start()
+
+# Renditions HLS pré-segmentadas: /videos/hls/<video_id>/master.m3u8 e
+# /videos/hls/<video_id>/<rendition>/{index.m3u8,init.mp4,seg_*.m4s|.ts}
+HLS_FOLDER = os.path.join(VIDEO_FOLDER, 'hls')
+HLS_NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+HLS_SEGMENT_RE = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]*$')
+HLS_MIME_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.aac': 'audio/aac',
+    '.vtt': 'text/vtt',
+}
+HLS_PLAYLIST_CACHE_CONTROL = f"public, max-age={int(os.environ.get('HLS_PLAYLIST_MAX_AGE', '60'))}"
+HLS_SEGMENT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Tamanho dos blocos do caminho de fallback (cópia dentro do processo)
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', str(1024 * 1024)))
+
+# Permite desligar o envio zero-copy (os.sendfile via wsgi.file_wrapper)
+STREAM_SENDFILE = os.environ.get('STREAM_SENDFILE', 'true').lower() == 'true'
+
+# Número máximo de ranges num pedido multi-range (acima disto o Range é ignorado)
+STREAM_MAX_RANGES = int(os.environ.get('STREAM_MAX_RANGES', '16'))
+
+def iter_file_range(f, start, length, chunk_size=None):
+    """Lê um range do ficheiro aberto em blocos (fallback sem zero-copy)."""
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    f.seek(start)
+    remaining = length
+    while remaining > 0:
+        data = f.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+def closing_iter(f, body):
+    """Fecha o ficheiro quando o corpo termina (ou o cliente desliga)."""
+    try:
+        yield from body
+    finally:
+        f.close()
+
+def file_range_body(f, start, length):
+    """
+    Corpo da resposta para `length` bytes a partir de `start`.
+    
+    Se o servidor WSGI disponibiliza wsgi.file_wrapper (gunicorn, waitress),
+    o ficheiro é entregue já posicionado em `start` e o servidor envia
+    exatamente Content-Length bytes - no gunicorn com os.sendfile, sem
+    passar os dados pelo Python. Caso contrário copia em blocos de
+    STREAM_CHUNK_SIZE.
+    """
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if STREAM_SENDFILE and file_wrapper is not None:
+        f.seek(start)
+        return file_wrapper(f, STREAM_CHUNK_SIZE)
+    return closing_iter(f, iter_file_range(f, start, length))
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         "status": "healthy", 
         "service": "streaming",
         "video_folder": VIDEO_FOLDER,
-        "videos_count": len([f for f in os.listdir(VIDEO_FOLDER) if f.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.webm'))])
+        "videos_count": video_index.video_count
     }), 200
 
+def etag_matches(header, etag, weak=True):
+    """Compara um header If-None-Match/If-Match com o ETag atual."""
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if weak and candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def not_modified(etag, mtime):
+    """Avalia If-None-Match / If-Modified-Since (RFC 7232)."""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    
+    if_modified_since = parse_date(request.headers.get('If-Modified-Since'))
+    if if_modified_since:
+        return int(mtime) <= int(if_modified_since.timestamp())
+    return False
+
+def if_range_allows(etag, mtime):
+    """If-Range: o Range só é aplicado se o validador ainda for o atual."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Comparação forte: ETags fracos nunca satisfazem If-Range
+        return if_range == etag
+    
+    date = parse_date(if_range)
+    return date is not None and int(date.timestamp()) == int(mtime)
+
+def parse_byte_ranges(range_header, file_size):
+    """
+    Interpreta um header Range (RFC 7233).
+    
+    Returns:
+        None se o header for inválido ou deve ser ignorado (resposta 200),
+        [] se nenhum range for satisfazível (resposta 416), ou uma lista
+        ordenada de (start, end) inclusivos, com sobreposições fundidas.
+    """
+    if not range_header.startswith('bytes='):
+        return None
+    
+    specs = [spec.strip() for spec in range_header[6:].split(',') if spec.strip()]
+    if not specs or len(specs) > STREAM_MAX_RANGES:
+        return None
+    
+    ranges = []
+    for spec in specs:
+        if '-' not in spec:
+            return None
+        start, end = spec.split('-', 1)
+        start, end = start.strip(), end.strip()
+        try:
+            if not start:
+                # Sufixo: bytes=-N -> últimos N bytes
+                suffix = int(end)
+                if suffix <= 0 or file_size == 0:
+                    # Ficheiro vazio: nenhum sufixo é satisfazível (416)
+                    continue
+                ranges.append((max(file_size - suffix, 0), file_size - 1))
+                continue
+            
+            byte_start = int(start)
+            byte_end = int(end) if end else file_size - 1
+        except ValueError:
+            return None
+        
+        if byte_start < 0 or (end and byte_end < byte_start):
+            return None
+        if byte_start >= file_size:
+            continue
+        ranges.append((byte_start, min(byte_end, file_size - 1)))
+    
+    # Fundir ranges sobrepostos ou contíguos
+    merged = []
+    for byte_start, byte_end in sorted(ranges):
+        if merged and byte_start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], byte_end))
+        else:
+            merged.append((byte_start, byte_end))
+    return merged
+
+def multipart_byteranges(f, ranges, file_size, mime_type):
+    """
+    Constrói um corpo multipart/byteranges.
+    
+    Returns:
+        (gerador do corpo, content-type, content-length)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for byte_start, byte_end in ranges:
+        header = (
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {mime_type}\r\n"
+            f"Content-Range: bytes {byte_start}-{byte_end}/{file_size}\r\n\r\n"
+        ).encode('latin-1')
+        parts.append((header, byte_start, byte_end - byte_start + 1))
+    closing = f"\r\n--{boundary}--\r\n".encode('latin-1')
+    
+    content_length = sum(len(header) + length for header, _, length in parts) + len(closing)
+    
+    def generate():
+        for header, byte_start, length in parts:
+            yield header
+            yield from iter_file_range(f, byte_start, length)
+        yield closing
+    
+    return closing_iter(f, generate()), f"multipart/byteranges; boundary={boundary}", content_length
+
+def serve_file(file_path, mime_type, extra_headers=None):
+    """
+    Resposta HTTP para um ficheiro com suporte a range requests (RFC 7233).
+    
+    Suporta validadores (ETag/Last-Modified), pedidos condicionais
+    (If-None-Match, If-Modified-Since, If-Range), ranges por sufixo e
+    multipart/byteranges para pedidos com vários ranges.
+    
+    Tamanho e validadores vêm do fstat do descritor aberto (não do índice):
+    depois de um os.replace o índice pode estar desatualizado, e o
+    Content-Length tem de corresponder aos bytes enviados.
+    """
+    f = open(file_path, 'rb')
+    try:
+        stat = os.fstat(f.fileno())
+        return file_response(f, stat.st_size, stat.st_mtime, make_etag(stat), mime_type, extra_headers)
+    except BaseException:
+        f.close()
+        raise
+
+def file_response(f, file_size, mtime, etag, mime_type, extra_headers):
+    """Resposta para o ficheiro aberto f; o corpo fecha-o no fim (senão fecha-se já)."""
+    validators = {
+        'Accept-Ranges': 'bytes',
+        'ETag': etag,
+        'Last-Modified': http_date(mtime),
+        **(extra_headers or {}),
+    }
+    
+    if not_modified(etag, mtime):
+        f.close()
+        return Response(status=304, headers=validators)
+    
+    # Verificar se é uma requisição Range aplicável
+    range_header = request.headers.get('Range', None)
+    ranges = None
+    if range_header and if_range_allows(etag, mtime):
+        ranges = parse_byte_ranges(range_header, file_size)
+    
+    if ranges == []:
+        # 416 Range Not Satisfiable
+        f.close()
+        return Response(
+            status=416,
+            headers={**validators, 'Content-Range': f'bytes */{file_size}'}
+        )
+    
+    if ranges and len(ranges) > 1:
+        body, content_type, content_length = multipart_byteranges(
+            f, ranges, file_size, mime_type
+        )
+        return Response(
+            body,
+            206,
+            headers={
+                **validators,
+                'Content-Type': content_type,
+                'Content-Length': str(content_length),
+            },
+            direct_passthrough=True
+        )
+    
+    if ranges:
+        byte_start, byte_end = ranges[0]
+        length = byte_end - byte_start + 1
+        
+        # Retornar resposta 206 Partial Content
+        return Response(
+            file_range_body(f, byte_start, length),
+            206,
+            headers={
+                **validators,
+                'Content-Type': mime_type,
+                'Content-Range': f'bytes {byte_start}-{byte_end}/{file_size}',
+                'Content-Length': str(length),
+            },
+            direct_passthrough=True
+        )
+    
+    # Retornar arquivo completo
+    return Response(
+        file_range_body(f, 0, file_size),
+        200,
+        headers={
+            **validators,
+            'Content-Type': mime_type,
+            'Content-Length': str(file_size),
+        },
+        direct_passthrough=True
+    )
+
 @app.route('/stream/<filename>')
 def stream_video(filename):
     """Stream de vídeo com suporte a range requests."""
     try:
-        file_path = os.path.join(VIDEO_FOLDER, filename)
+        entry = video_index.get(filename)
         
-        if not os.path.exists(file_path):
+        if not entry:
             logger.warning(f"Vídeo não encontrado: {filename}")
             return jsonify({"error": "Video not found"}), 404
         
-        def generate():
-            with open(file_path, 'rb') as f:
-                data = f.read(1024)
-                while data:
-                    yield data
-                    data = f.read(1024)
-        
-        # Detectar tipo MIME
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if not mime_type:
-            mime_type = 'video/mp4'
-        
-        # Obter tamanho do arquivo
-        file_size = os.path.getsize(file_path)
+        # O índice resolve o nome e o tipo; tamanho e validadores vêm do ficheiro aberto
+        return serve_file(os.path.join(VIDEO_FOLDER, entry.filename), entry.mime_type)
+    
+    except FileNotFoundError:
+        # Entrada do índice desatualizada (ficheiro removido entretanto)
+        video_index.refresh(filename)
+        return jsonify({"error": "Video not found"}), 404
+    except Exception as e:
+        logger.error(f"Erro ao fazer stream do vídeo {filename}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+def serve_hls_file(video_id, relative_path, cache_control):
+    """Serve um ficheiro da árvore HLS de um vídeo (playlist ou segmento)."""
+    extension = os.path.splitext(relative_path)[1].lower()
+    mime_type = HLS_MIME_TYPES.get(extension)
+    if not mime_type:
+        return jsonify({"error": "Not found"}), 404
+    
+    file_path = os.path.join(HLS_FOLDER, video_id, relative_path)
+    try:
+        return serve_file(file_path, mime_type, extra_headers={'Cache-Control': cache_control})
+    except (FileNotFoundError, NotADirectoryError):
+        return jsonify({"error": "Not found"}), 404
+
+@app.route('/hls/<video_id>/master.m3u8')
+def hls_master_playlist(video_id):
+    """Master playlist HLS (lista de renditions) de um vídeo."""
+    try:
+        if not HLS_NAME_RE.match(video_id):
+            return jsonify({"error": "Not found"}), 404
+        return serve_hls_file(video_id, 'master.m3u8', HLS_PLAYLIST_CACHE_CONTROL)
+    except Exception as e:
+        logger.error(f"Erro ao servir master playlist do vídeo {video_id}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/hls/<video_id>/<rendition>/<segment>')
+def hls_segment(video_id, rendition, segment):
+    """Playlist de variante ou segmento (TS/fMP4) de uma rendition."""
+    try:
+        if not (HLS_NAME_RE.match(video_id) and HLS_NAME_RE.match(rendition)
+                and HLS_SEGMENT_RE.match(segment)):
+            return jsonify({"error": "Not found"}), 404
         
-        # Verificar se é uma requisição Range
-        range_header = request.headers.get('Range', None)
-        if range_header:
-            # Parse do header Range
-            byte_start = 0
-            byte_end = file_size - 1
-            
-            if range_header.startswith('bytes='):
-                byte_range = range_header[6:]
-                if '-' in byte_range:
-                    start, end = byte_range.split('-', 1)
-                    if start:
-                        byte_start = int(start)
-                    if end:
-                        byte_end = int(end)
-            
-            # Ler apenas o range solicitado
-            def generate_range():
-                with open(file_path, 'rb') as f:
-                    f.seek(byte_start)
-                    remaining = byte_end - byte_start + 1
-                    while remaining:
-                        chunk_size = min(1024, remaining)
-                        data = f.read(chunk_size)
-                        if not data:
-                            break
-                        yield data
-                        remaining -= len(data)
-            
-            # Retornar resposta 206 Partial Content
-            response = Response(
-                generate_range(),
-                206,
-                headers={
-                    'Content-Type': mime_type,
-                    'Accept-Ranges': 'bytes',
-                    'Content-Range': f'bytes {byte_start}-{byte_end}/{file_size}',
-                    'Content-Length': str(byte_end - byte_start + 1),
-                }
-            )
-            return response
+        # Segmentos nunca são reescritos: podem ficar em cache indefinidamente
+        if segment.endswith('.m3u8'):
+            cache_control = HLS_PLAYLIST_CACHE_CONTROL
         else:
-            # Retornar arquivo completo
-            response = Response(
-                generate(),
-                200,
-                headers={
-                    'Content-Type': mime_type,
-                    'Accept-Ranges': 'bytes',
-                    'Content-Length': str(file_size),
-                }
-            )
-            return response
-            
+            cache_control = HLS_SEGMENT_CACHE_CONTROL
+        return serve_hls_file(video_id, os.path.join(rendition, segment), cache_control)
     except Exception as e:
-        logger.error(f"Erro ao fazer stream do vídeo {filename}: {e}")
+        logger.error(f"Erro ao servir segmento HLS {video_id}/{rendition}/{segment}: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 @app.route('/download/<filename>')
@@ -138,21 +392,18 @@ def download_video(filename):
 def video_info(filename):
     """Informações sobre o vídeo."""
     try:
-        file_path = os.path.join(VIDEO_FOLDER, filename)
+        entry = video_index.get(filename)
         
-        if not os.path.exists(file_path):
+        if not entry:
             return jsonify({"error": "Video not found"}), 404
         
-        stat = os.stat(file_path)
-        mime_type, _ = mimetypes.guess_type(file_path)
-        
         info = {
             "filename": filename,
-            "size": stat.st_size,
-            "size_mb": round(stat.st_size / (1024 * 1024), 2),
-            "mime_type": mime_type or "video/mp4",
-            "created": stat.st_ctime,
-            "modified": stat.st_mtime
+            "size": entry.size,
+            "size_mb": round(entry.size / (1024 * 1024), 2),
+            "mime_type": entry.mime_type,
+            "created": entry.ctime,
+            "modified": entry.mtime
         }
         
         return jsonify(info)
@@ -165,17 +416,15 @@ def video_info(filename):
 def list_available_videos():
     """Lista vídeos disponíveis no storage."""
     try:
-        videos = []
-        for filename in os.listdir(VIDEO_FOLDER):
-            if filename.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.webm')):
-                file_path = os.path.join(VIDEO_FOLDER, filename)
-                stat = os.stat(file_path)
-                videos.append({
-                    "filename": filename,
-                    "size": stat.st_size,
-                    "size_mb": round(stat.st_size / (1024 * 1024), 2),
-                    "url": f"/stream/{filename}"
-                })
+        videos = [
+            {
+                "filename": entry.filename,
+                "size": entry.size,
+                "size_mb": round(entry.size / (1024 * 1024), 2),
+                "url": f"/stream/{entry.filename}"
+            }
+            for entry in video_index.videos()
+        ]
         
         return jsonify({
             "count": len(videos),
@@ -190,19 +439,16 @@ def list_available_videos():
 def status_endpoint():
     """Endpoint para informações do serviço."""
     try:
-        video_count = len([f for f in os.listdir(VIDEO_FOLDER) 
-                          if f.lower().endswith(('.mp4', '.avi', '.mov', '.mkv', '.webm'))])
-        
-        total_size = sum(os.path.getsize(os.path.join(VIDEO_FOLDER, f)) 
-                        for f in os.listdir(VIDEO_FOLDER) if os.path.isfile(os.path.join(VIDEO_FOLDER, f)))
+        total_size = video_index.total_size
         
         status_data = {
             "service": "streaming",
             "status": "healthy",
-            "video_count": video_count,
+            "video_count": video_index.video_count,
             "total_size_bytes": total_size,
             "total_size_gb": round(total_size / (1024 * 1024 * 1024), 2),
-            "storage_path": VIDEO_FOLDER
+            "storage_path": VIDEO_FOLDER,
+            "index": video_index.stats()
         }
         
         return jsonify(status_data)
@@ -0,0 +1,57 @@
+"""
+Testes dos range requests do streaming_service.
+
+    cd streaming_service && python -m unittest test_app
+"""
+import os
+import tempfile
+import unittest
+
+from app import app, parse_byte_ranges, serve_file
+
+class ParseByteRangesTest(unittest.TestCase):
+
+    def test_single_and_suffix_ranges(self):
+        self.assertEqual(parse_byte_ranges('bytes=0-9', 100), [(0, 9)])
+        self.assertEqual(parse_byte_ranges('bytes=90-', 100), [(90, 99)])
+        self.assertEqual(parse_byte_ranges('bytes=-5', 100), [(95, 99)])
+        self.assertEqual(parse_byte_ranges('bytes=-500', 100), [(0, 99)])
+
+    def test_overlapping_ranges_are_merged(self):
+        self.assertEqual(parse_byte_ranges('bytes=0-9,5-19,50-', 100), [(0, 19), (50, 99)])
+
+    def test_invalid_header_is_ignored(self):
+        self.assertIsNone(parse_byte_ranges('items=0-9', 100))
+        self.assertIsNone(parse_byte_ranges('bytes=9-0', 100))
+        self.assertIsNone(parse_byte_ranges('bytes=a-b', 100))
+
+    def test_unsatisfiable_ranges(self):
+        self.assertEqual(parse_byte_ranges('bytes=100-', 100), [])
+        self.assertEqual(parse_byte_ranges('bytes=0-', 0), [])
+        self.assertEqual(parse_byte_ranges('bytes=-5', 0), [])
+
+class ServeFileTest(unittest.TestCase):
+
+    def serve(self, content, headers):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        with app.test_request_context(headers=headers):
+            response = serve_file(f.name, 'video/mp4')
+            body = b''.join(response.response) if response.status_code < 300 else b''
+            response.close()
+            return response, body
+
+    def test_suffix_range(self):
+        response, body = self.serve(b'0123456789', {'Range': 'bytes=-3'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.headers['Content-Range'], 'bytes 7-9/10')
+        self.assertEqual(body, b'789')
+
+    def test_suffix_range_on_empty_file_is_416(self):
+        response, _ = self.serve(b'', {'Range': 'bytes=-5'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response.headers['Content-Range'], 'bytes */0')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Índice em memória da pasta de vídeos - Streaming Service
+
+Mantém filename -> (size, mtime, mime, etag) para que /health, /list,
+/status, /info e /stream não façam listdir + stat por pedido.
+- inotify (inotify_simple) mantém o índice atualizado por eventos
+- Rescan periódico como fallback (e quando o inotify não está disponível)
+"""
+
+import os
+import time
+import logging
+import mimetypes
+import threading
+from stat import S_ISREG
+from collections import namedtuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # inotify é opcional: sem ele fica só o rescan periódico
+    INotify = None
+    inotify_flags = None
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm')
+
+# Intervalo do rescan completo (fallback ao inotify)
+RESCAN_INTERVAL = float(os.environ.get('VIDEO_INDEX_RESCAN_SECONDS', '60'))
+
+# ================================================================
+# MÉTRICAS
+# ================================================================
+
+INDEX_ENTRIES = Gauge('streaming_index_entries', 'Files currently in the video index')
+INDEX_VIDEOS = Gauge('streaming_index_videos', 'Video files currently in the video index')
+INDEX_BYTES = Gauge('streaming_index_size_bytes', 'Total size of indexed files')
+INDEX_REFRESHES = Counter('streaming_index_refresh_total', 'Index refreshes', ['kind'])
+INDEX_RESCAN_TIME = Histogram('streaming_index_rescan_seconds', 'Time spent on full index rescans')
+
+VideoEntry = namedtuple('VideoEntry', ['filename', 'size', 'mtime', 'mtime_ns', 'ctime', 'mime_type', 'etag', 'is_video'])
+
+def make_etag(stat):
+    """ETag forte derivado do tamanho e do mtime (ns) do ficheiro."""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+def is_video_file(filename):
+    return filename.lower().endswith(VIDEO_EXTENSIONS)
+
+def make_entry(filename, stat):
+    mime_type, _ = mimetypes.guess_type(filename)
+    return VideoEntry(
+        filename=filename,
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        mtime_ns=stat.st_mtime_ns,
+        ctime=stat.st_ctime,
+        mime_type=mime_type or 'video/mp4',
+        etag=make_etag(stat),
+        is_video=is_video_file(filename)
+    )
+
+class VideoIndex:
+    """Índice dos ficheiros (não recursivo) de uma pasta."""
+
+    def __init__(self, folder, rescan_interval=RESCAN_INTERVAL):
+        self.folder = folder
+        self.rescan_interval = rescan_interval
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._total_size = 0
+        self._video_count = 0
+        self._thread = None
+        self._inotify = None
+        self.last_rescan = None
+        self.last_rescan_seconds = None
+        self.events_applied = 0
+
+    # ------------------------------------------------------------
+    # Leitura (O(1), sem syscalls)
+    # ------------------------------------------------------------
+
+    def get(self, filename):
+        """Entrada do índice; em caso de miss tenta um stat e indexa."""
+        entry = self._entries.get(filename)
+        if entry is None:
+            entry = self.refresh(filename)
+        return entry
+
+    def videos(self):
+        """Snapshot das entradas de vídeo."""
+        return [entry for entry in list(self._entries.values()) if entry.is_video]
+
+    @property
+    def video_count(self):
+        return self._video_count
+
+    @property
+    def total_size(self):
+        return self._total_size
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "videos": self._video_count,
+            "total_size_bytes": self._total_size,
+            "inotify": self._inotify is not None,
+            "events_applied": self.events_applied,
+            "last_rescan": self.last_rescan,
+            "last_rescan_seconds": self.last_rescan_seconds,
+        }
+
+    # ------------------------------------------------------------
+    # Atualização
+    # ------------------------------------------------------------
+
+    def _set(self, filename, entry):
+        """Substitui/remove uma entrada mantendo os agregados (com lock)."""
+        old = self._entries.pop(filename, None)
+        if old:
+            self._total_size -= old.size
+            self._video_count -= old.is_video
+        if entry:
+            self._entries[filename] = entry
+            self._total_size += entry.size
+            self._video_count += entry.is_video
+
+    def _update_gauges(self):
+        INDEX_ENTRIES.set(len(self._entries))
+        INDEX_VIDEOS.set(self._video_count)
+        INDEX_BYTES.set(self._total_size)
+
+    def refresh(self, filename):
+        """Re-stat de um único ficheiro (evento inotify ou miss)."""
+        if not filename or '/' in filename or filename.startswith('.'):
+            return None
+
+        try:
+            stat = os.stat(os.path.join(self.folder, filename))
+            entry = make_entry(filename, stat) if S_ISREG(stat.st_mode) else None
+        except (FileNotFoundError, NotADirectoryError):
+            entry = None
+
+        with self._lock:
+            self._set(filename, entry)
+            self._update_gauges()
+        return entry
+
+    def rescan(self):
+        """Reconstrói o índice completo a partir do disco."""
+        start_time = time.time()
+        entries = {}
+        total_size = 0
+        video_count = 0
+
+        with os.scandir(self.folder) as it:
+            for dir_entry in it:
+                if dir_entry.name.startswith('.'):
+                    continue
+                try:
+                    if not dir_entry.is_file():
+                        continue
+                    entry = make_entry(dir_entry.name, dir_entry.stat())
+                except FileNotFoundError:
+                    continue
+                entries[entry.filename] = entry
+                total_size += entry.size
+                video_count += entry.is_video
+
+        with self._lock:
+            self._entries = entries
+            self._total_size = total_size
+            self._video_count = video_count
+            self._update_gauges()
+
+        elapsed = time.time() - start_time
+        self.last_rescan = time.time()
+        self.last_rescan_seconds = round(elapsed, 4)
+        INDEX_RESCAN_TIME.observe(elapsed)
+        INDEX_REFRESHES.labels(kind='rescan').inc()
+        logger.debug(f"Índice de vídeos reconstruído: {len(entries)} ficheiros em {elapsed:.3f}s")
+
+    # ------------------------------------------------------------
+    # Manutenção em background
+    # ------------------------------------------------------------
+
+    def _init_inotify(self):
+        if INotify is None:
+            logger.warning("⚠️ inotify_simple não disponível, índice apenas com rescan periódico")
+            return None
+        try:
+            inotify = INotify()
+            watch_flags = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO |
+                           inotify_flags.MOVED_FROM | inotify_flags.DELETE |
+                           inotify_flags.CREATE | inotify_flags.ATTRIB)
+            inotify.add_watch(self.folder, watch_flags)
+            logger.info("✅ inotify ativo para o índice de vídeos")
+            return inotify
+        except OSError as e:
+            logger.warning(f"⚠️ Erro ao iniciar inotify ({e}), índice apenas com rescan periódico")
+            return None
+
+    def _run(self):
+        next_rescan = time.time() + self.rescan_interval
+        while True:
+            try:
+                timeout = max(next_rescan - time.time(), 0)
+                if self._inotify:
+                    events = self._inotify.read(timeout=int(timeout * 1000))
+                    if any(event.mask & inotify_flags.Q_OVERFLOW for event in events):
+                        # Fila do kernel transbordou: eventos perdidos
+                        next_rescan = 0
+                    else:
+                        for event in events:
+                            self.refresh(event.name)
+                            self.events_applied += 1
+                        if events:
+                            INDEX_REFRESHES.labels(kind='event').inc(len(events))
+                else:
+                    time.sleep(timeout)
+
+                if time.time() >= next_rescan:
+                    self.rescan()
+                    next_rescan = time.time() + self.rescan_interval
+            except Exception as e:
+                logger.error(f"Erro na manutenção do índice de vídeos: {e}")
+                time.sleep(1)
+
+    def start(self):
+        """Faz o scan inicial e inicia a thread de manutenção."""
+        # O watch é registado antes do scan para não perder alterações
+        self._inotify = self._init_inotify()
+        self.rescan()
+
+        self._thread = threading.Thread(target=self._run, name='video-index')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
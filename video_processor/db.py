@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Database Connection Manager - Video Processor
+Escrita dos resultados do processamento na tabela videos
+
+- Pool de conexões ao Master (escritas)
+- Resultados agrupados em lotes: um UPDATE ... FROM (VALUES ...) por lote
+"""
+
+import psycopg2
+import psycopg2.pool
+import psycopg2.extras
+import os
+import queue
+import logging
+import threading
+import time
+
+from prometheus_client import Counter, Histogram
+
+# Configuração de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ================================================================
+# CONFIGURAÇÕES DE CONEXÃO
+# ================================================================
+
+# Configuração Master (escritas)
+MASTER_CONFIG = {
+    'host': os.environ.get('DB_MASTER_HOST', 'ualflix_db_master'),
+    'port': int(os.environ.get('DB_MASTER_PORT', '5432')),
+    'database': os.environ.get('DB_NAME', 'ualflix'),
+    'user': os.environ.get('DB_USER', 'postgres'),
+    'password': os.environ.get('DB_PASSWORD', 'password'),
+    'sslmode': 'prefer'
+}
+
+# Tamanho máximo do lote e tempo máximo que um resultado espera pelo lote
+RESULTS_BATCH_SIZE = int(os.environ.get('RESULTS_BATCH_SIZE', '50'))
+RESULTS_BATCH_INTERVAL = float(os.environ.get('RESULTS_BATCH_INTERVAL', '1.0'))
+
+# Tentativas de um lote antes de o dividir (uma linha inválida não pode parar as restantes)
+RESULTS_WRITE_ATTEMPTS = int(os.environ.get('RESULTS_WRITE_ATTEMPTS', '5'))
+
+# Estados escritos na coluna videos.status
+STATUS_READY = 'active'
+STATUS_FAILED = 'failed'
+
+RESULTS_WRITTEN = Counter('video_results_written_total', 'Processing results written to the catalog')
+RESULTS_BATCHES = Counter('video_results_batches_total', 'Result batches written to the catalog')
+RESULTS_WRITE_ERRORS = Counter('video_results_write_errors_total', 'Failed result batch writes')
+RESULTS_DROPPED = Counter('video_results_dropped_total', 'Results that could not be written, even as failed')
+RESULTS_BATCH_TIME = Histogram('video_results_batch_seconds', 'Time spent writing a result batch')
+
+UPDATE_RESULTS_SQL = """
+    UPDATE videos AS v
+    SET duration = data.duration,
+        thumbnail_path = COALESCE(data.thumbnail_path, v.thumbnail_path),
+        status = data.status
+    FROM (VALUES %s) AS data(id, duration, thumbnail_path, status)
+    WHERE v.id = data.id
+"""
+
+# Pool de conexões
+master_pool = None
+
+def init_connection_pool():
+    """Inicializar pool de conexões ao Master"""
+    global master_pool
+
+    master_pool = psycopg2.pool.ThreadedConnectionPool(
+        minconn=1,
+        maxconn=2,
+        **MASTER_CONFIG
+    )
+    logger.info("✅ Pool Master inicializado (Video Processor)")
+
+def get_db_connection():
+    """Obter conexão do pool (inicializa o pool se necessário)"""
+    if not master_pool:
+        init_connection_pool()
+    return master_pool.getconn()
+
+def return_db_connection(conn, discard=False):
+    """Retornar conexão para o pool (discard=True fecha conexões com erro)"""
+    try:
+        master_pool.putconn(conn, close=discard)
+    except Exception as e:
+        logger.error(f"Erro ao retornar conexão: {e}")
+
+def result_row(results):
+    """Linha (id, duration, thumbnail_path, status) para o UPDATE em lote."""
+    duration = results.get('duration')
+    return (
+        results['id'],
+        int(round(duration)) if duration else None,
+        results.get('thumbnail_path') if results.get('thumbnail') else None,
+        STATUS_READY if results.get('success') else STATUS_FAILED,
+    )
+
+def write_results_batch(rows):
+    """
+    Escreve um lote de resultados numa só transação.
+
+    Devolve o LSN do master após o commit (vai nos eventos catalog_events,
+    para a cache do catálogo só reler réplicas que já têm estas escritas).
+    """
+    conn = get_db_connection()
+    discard = False
+    try:
+        cursor = conn.cursor()
+        psycopg2.extras.execute_values(
+            cursor, UPDATE_RESULTS_SQL, rows,
+            template='(%s::integer, %s::integer, %s::varchar, %s::varchar)',
+            page_size=len(rows)
+        )
+        conn.commit()
+        cursor.execute("SELECT pg_current_wal_lsn()::text")
+        lsn = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+        return lsn
+    except Exception:
+        discard = conn.closed != 0
+        if not discard:
+            conn.rollback()
+        raise
+    finally:
+        return_db_connection(conn, discard=discard)
+
+class ResultsBatchWriter:
+    """
+    Agrupa resultados de vários jobs e escreve-os em lote.
+
+    Cada resultado pode levar um callback chamado depois do commit do seu
+    lote com o LSN desse commit (usado para fazer o ack da mensagem só após
+    a escrita e anunciar a mudança ao catálogo).
+
+    Um lote que falha RESULTS_WRITE_ATTEMPTS vezes é dividido ao meio até
+    isolar as linhas que falham; essas são gravadas só como failed e, se nem
+    isso for possível, chamam on_error (a mensagem volta à fila).
+    """
+
+    def __init__(self, batch_size=RESULTS_BATCH_SIZE, interval=RESULTS_BATCH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def submit(self, results, on_written=None, on_error=None):
+        """Agenda a escrita de um resultado (não bloqueia)."""
+        if results.get('id') is None:
+            # Mensagens sem id não têm linha na tabela videos
+            if on_written:
+                on_written(None)
+            return
+        self._queue.put((result_row(results), on_written, on_error))
+
+    def _next_batch(self):
+        """Espera pelo primeiro item e junta os que chegarem até ao intervalo."""
+        batch = [self._queue.get()]
+        deadline = time.time() + self.interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows, attempts):
+        """write_results_batch com até attempts tentativas (backoff entre elas)."""
+        for attempt in range(1, attempts + 1):
+            try:
+                return write_results_batch(rows)
+            except Exception as e:
+                RESULTS_WRITE_ERRORS.inc()
+                logger.error(f"Erro ao escrever lote de {len(rows)} resultados (tentativa {attempt}): {e}")
+                if attempt == attempts:
+                    raise
+                time.sleep(min(30, 2 ** attempt))
+
+    def _write_or_split(self, rows, attempts):
+        """
+        Escreve as linhas e devolve {id: LSN}; LSN None = não foi gravada.
+
+        Depois da primeira divisão cada parte tem uma só tentativa.
+        """
+        try:
+            lsn = self._write(rows, attempts)
+            return {row[0]: lsn for row in rows}
+        except Exception:
+            pass
+
+        if len(rows) > 1:
+            middle = len(rows) // 2
+            written = self._write_or_split(rows[:middle], 1)
+            written.update(self._write_or_split(rows[middle:], 1))
+            return written
+
+        # Linha que falha sozinha: gravar só o estado failed
+        video_id = rows[0][0]
+        try:
+            lsn = write_results_batch([(video_id, None, None, STATUS_FAILED)])
+            logger.error(f"Resultado do vídeo {video_id} rejeitado pela base de dados; marcado como failed")
+            return {video_id: lsn}
+        except Exception as e:
+            RESULTS_DROPPED.inc()
+            logger.error(f"Não foi possível gravar o vídeo {video_id} como failed: {e}")
+            return {video_id: None}
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            rows = {}
+            for row, _, _ in batch:
+                # O último resultado de cada vídeo prevalece dentro do lote
+                rows[row[0]] = row
+
+            batch_start = time.time()
+            written = self._write_or_split(list(rows.values()), RESULTS_WRITE_ATTEMPTS)
+            done = sum(1 for lsn in written.values() if lsn is not None)
+
+            RESULTS_BATCH_TIME.observe(time.time() - batch_start)
+            RESULTS_BATCHES.inc()
+            RESULTS_WRITTEN.inc(done)
+            logger.info(f"💾 Lote de {done}/{len(rows)} resultados escrito no catálogo")
+
+            for row, on_written, on_error in batch:
+                lsn = written[row[0]]
+                try:
+                    if lsn is not None:
+                        if on_written:
+                            on_written(lsn)
+                    elif on_error:
+                        on_error()
+                except Exception as e:
+                    logger.error(f"Erro no callback pós-escrita: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='results-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
@@ -4,10 +4,22 @@ import json
 import os
 import time
 import logging
+import re
+import math
+import fcntl
+import shutil
+import tempfile
 import threading
+import functools
 import subprocess
+import multiprocessing
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from flask import Flask, jsonify
 from prometheus_client import Counter, Histogram, Gauge, start_http_server
+from db import ResultsBatchWriter
 
 # Configuração de logging
 logging.basicConfig(level=logging.INFO)
@@ -17,16 +29,72 @@ logger = logging.getLogger(__name__)
 VIDEOS_PROCESSED = Counter('videos_processed_total', 'Total videos processed')
 VIDEOS_FAILED = Counter('videos_failed_total', 'Total videos failed')
 PROCESSING_TIME = Histogram('video_processing_seconds', 'Time spent processing videos')
+STAGE_TIME = Histogram('video_processing_stage_seconds', 'Time spent in each processing stage', ['stage'],
+                       buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
 QUEUE_SIZE = Gauge('video_queue_size', 'Current queue size')
+ACTIVE_JOBS = Gauge('video_processing_active_jobs', 'Videos currently being processed')
+CACHE_HITS = Counter('video_cache_hits_total', 'Processing artifacts reused from the content cache', ['artifact'])
 
 # Diretório onde os vídeos estão armazenados
 VIDEO_FOLDER = '/videos'
 os.makedirs(VIDEO_FOLDER, exist_ok=True)
 
+# Saída HLS/CMAF: /videos/hls/<video_id>/master.m3u8 + uma pasta por rendition
+HLS_FOLDER = os.path.join(VIDEO_FOLDER, 'hls')
+
+# Resultados em cache por conteúdo (SHA-256 do upload):
+# /videos/cache/<sha256>/{probe.json,hls/}
+CACHE_FOLDER = os.path.join(VIDEO_FOLDER, 'cache')
+
+# Escada ABR "nome:altura:bitrate_video:bitrate_audio" separada por vírgulas.
+# Renditions acima da resolução original são descartadas; vazio desliga o HLS.
+ABR_LADDER = os.environ.get(
+    'ABR_LADDER',
+    '240p:240:400k:64k,480p:480:1000k:96k,720p:720:2500k:128k,1080p:1080:5000k:128k'
+)
+HLS_SEGMENT_SECONDS = int(os.environ.get('HLS_SEGMENT_SECONDS', '6'))
+TRANSCODE_PRESET = os.environ.get('TRANSCODE_PRESET', 'veryfast')
+TRANSCODE_TIMEOUT = int(os.environ.get('TRANSCODE_TIMEOUT', '7200'))
+
+# Jobs em simultâneo (um processo por job) e respetiva janela de prefetch
+PROCESSOR_WORKERS = max(1, int(os.environ.get('PROCESSOR_WORKERS', '2')))
+
+# Transcodificação em paralelo por chunks (cortados em keyframes).
+# Por omissão os cores são repartidos pelos jobs em simultâneo.
+PARALLEL_TRANSCODE = os.environ.get('PARALLEL_TRANSCODE', 'true').lower() == 'true'
+TRANSCODE_WORKERS = (int(os.environ.get('TRANSCODE_WORKERS', '0')) or
+                     max(1, len(os.sched_getaffinity(0)) // PROCESSOR_WORKERS))
+TRANSCODE_MIN_CHUNK_SECONDS = int(os.environ.get('TRANSCODE_MIN_CHUNK_SECONDS', '30'))
+# Tolerância da verificação de duração do resultado concatenado
+TRANSCODE_DURATION_TOLERANCE = float(os.environ.get('TRANSCODE_DURATION_TOLERANCE', '0.5'))
+
+# level: nível H.264 (ex.: 31 = 3.1), calculado por select_renditions para o vídeo
+Rendition = namedtuple('Rendition', ['name', 'height', 'video_bitrate', 'audio_bitrate', 'level'],
+                       defaults=(None,))
+
+# Limites dos níveis H.264 (perfil Main): (nível, macroblocos/s, macroblocos
+# por frame, bitrate máximo em kbit/s, buffer VBV máximo em kbit)
+H264_LEVELS = [
+    (30, 40500, 1620, 10000, 10000),
+    (31, 108000, 3600, 14000, 14000),
+    (32, 216000, 5120, 20000, 20000),
+    (40, 245760, 8192, 20000, 25000),
+    (41, 245760, 8192, 50000, 62500),
+    (42, 522240, 8704, 50000, 62500),
+    (50, 589824, 22080, 135000, 135000),
+    (51, 983040, 36864, 240000, 240000),
+    (52, 2073600, 36864, 240000, 240000),
+]
+
 # Variáveis de ambiente
 QUEUE_HOST = os.environ.get('QUEUE_HOST', 'queue_service')
 QUEUE_USER = os.environ.get('QUEUE_USER', 'ualflix')
 QUEUE_PASSWORD = os.environ.get('QUEUE_PASSWORD', 'ualflix_password')
+# A thread da conexão fica livre durante os jobs, por isso o heartbeat pode ser curto
+QUEUE_HEARTBEAT = int(os.environ.get('QUEUE_HEARTBEAT', '60'))
+
+# Exchange fanout onde o catalog_service escuta mudanças nos vídeos
+CATALOG_EVENTS_EXCHANGE = 'catalog_events'
 
 app = Flask(__name__)
 
@@ -71,7 +139,7 @@ def connect_to_rabbitmq():
         parameters = pika.ConnectionParameters(
             host=QUEUE_HOST,
             credentials=credentials,
-            heartbeat=600,
+            heartbeat=QUEUE_HEARTBEAT,
             blocked_connection_timeout=300
         )
         connection = pika.BlockingConnection(parameters)
@@ -80,8 +148,12 @@ def connect_to_rabbitmq():
         # Declara a fila para processamento de vídeos
         channel.queue_declare(queue='video_processing', durable=True)
         
-        # Configura QoS para não sobrecarregar o worker
-        channel.basic_qos(prefetch_count=1)
+        # Eventos de mudança no catálogo (invalidam a cache do catalog_service)
+        channel.exchange_declare(exchange=CATALOG_EVENTS_EXCHANGE, exchange_type='fanout', durable=True)
+        
+        # Prefetch igual ao número de workers: nunca há mais mensagens
+        # por confirmar do que jobs em execução
+        channel.basic_qos(prefetch_count=PROCESSOR_WORKERS)
         
         return connection, channel
     except Exception as e:
@@ -102,11 +174,16 @@ def get_video_info(filepath):
         logger.warning(f"Erro ao obter informações do vídeo: {e}")
     return None
 
-def create_thumbnail(filepath, output_path):
-    """Cria uma thumbnail do vídeo."""
+def create_thumbnail(filepath, output_path, seek=1.0):
+    """
+    Cria uma thumbnail do vídeo.
+    
+    O -ss vem antes do -i (seek no input): o ffmpeg salta para o keyframe
+    mais próximo em vez de descodificar o vídeo desde o início.
+    """
     try:
         cmd = [
-            'ffmpeg', '-i', filepath, '-ss', '00:00:01.000', '-vframes', '1',
+            'ffmpeg', '-ss', f"{seek:.3f}", '-i', filepath, '-vframes', '1',
             '-vf', 'scale=320:240', '-y', output_path
         ]
         result = subprocess.run(cmd, capture_output=True, timeout=60)
@@ -115,101 +192,760 @@ def create_thumbnail(filepath, output_path):
         logger.warning(f"Erro ao criar thumbnail: {e}")
         return False
 
+def parse_bitrate(value):
+    """Converte '2500k' / '5M' / '800000' em bits por segundo."""
+    value = value.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000 * 1000}.get(value[-1:], 1)
+    if value[-1:] in ('k', 'm'):
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+def parse_abr_ladder(ladder=None):
+    """Interpreta ABR_LADDER numa lista de Rendition ordenada por altura."""
+    renditions = []
+    for spec in (ladder if ladder is not None else ABR_LADDER).split(','):
+        spec = spec.strip()
+        if not spec:
+            continue
+        try:
+            name, height, video_bitrate, audio_bitrate = spec.split(':')
+            renditions.append(Rendition(name, int(height), parse_bitrate(video_bitrate), parse_bitrate(audio_bitrate)))
+        except ValueError:
+            logger.warning(f"Rendition inválida em ABR_LADDER ignorada: {spec}")
+    return sorted(renditions, key=lambda r: r.height)
+
+def get_stream(video_info, codec_type):
+    """Primeiro stream do tipo pedido ('video'/'audio') na saída do ffprobe."""
+    for stream in (video_info or {}).get('streams', []):
+        if stream.get('codec_type') == codec_type:
+            return stream
+    return None
+
+def select_renditions(video_info, ladder=None):
+    """
+    Renditions da escada ABR aplicáveis ao vídeo.
+    
+    Nunca faz upscale: só ficam as alturas <= altura original. Se o vídeo
+    for mais pequeno que o primeiro degrau, usa esse degrau à altura original.
+    """
+    ladder = parse_abr_ladder(ladder)
+    video_stream = get_stream(video_info, 'video')
+    if not ladder or not video_stream or not video_stream.get('height'):
+        return []
+    
+    source_height = int(video_stream['height'])
+    selected = [r for r in ladder if r.height <= source_height]
+    if not selected:
+        selected = [ladder[0]._replace(height=source_height - source_height % 2)]
+    return [r._replace(level=h264_level(video_info, r)) for r in selected]
+
+def rendition_width(video_info, height):
+    """Largura (par) que mantém o aspect ratio para a altura dada."""
+    video_stream = get_stream(video_info, 'video')
+    width = int(video_stream['width']) * height / int(video_stream['height'])
+    return int(round(width / 2) * 2)
+
+def frame_rate(video_info):
+    """Frame rate do stream de vídeo (30 se o ffprobe não o indicar)."""
+    video_stream = get_stream(video_info, 'video') or {}
+    for key in ('avg_frame_rate', 'r_frame_rate'):
+        num, _, den = str(video_stream.get(key, '')).partition('/')
+        try:
+            rate = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            continue
+        if rate > 0:
+            return rate
+    return 30.0
+
+def rendition_maxrate(rendition):
+    return int(rendition.video_bitrate * 1.07)
+
+def rendition_bufsize(rendition):
+    return rendition.video_bitrate * 2
+
+def h264_level(video_info, rendition):
+    """Menor nível H.264 que comporta a resolução, o frame rate e o VBV da rendition."""
+    frame_mbs = math.ceil(rendition_width(video_info, rendition.height) / 16) * math.ceil(rendition.height / 16)
+    mbs_per_second = frame_mbs * frame_rate(video_info)
+    for level, max_mbps, max_frame_mbs, max_bitrate, max_buffer in H264_LEVELS:
+        if (frame_mbs <= max_frame_mbs and mbs_per_second <= max_mbps
+                and rendition_maxrate(rendition) <= max_bitrate * 1000
+                and rendition_bufsize(rendition) <= max_buffer * 1000):
+            return level
+    return H264_LEVELS[-1][0]
+
+def rendition_codecs(rendition, has_audio):
+    """CODECS do master.m3u8: perfil Main (4d40) com o nível da rendition."""
+    codecs = f"avc1.4d40{rendition.level:02x}"
+    return f"{codecs},mp4a.40.2" if has_audio else codecs
+
+def run_ffmpeg(cmd, error_context):
+    """Executa o ffmpeg e lança exceção com o fim do stderr em caso de erro."""
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=TRANSCODE_TIMEOUT)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg falhou ({error_context}): {result.stderr.strip()[-500:]}")
+
+def video_encode_args(rendition, threads=None, scale=True):
+    """
+    Argumentos do encoder de vídeo (iguais em todos os modos).
+    
+    scale=False quando o scale já vem de um -filter_complex.
+    """
+    args = ['-vf', f"scale=-2:{rendition.height}"] if scale else []
+    args += [
+        '-c:v', 'libx264', '-preset', TRANSCODE_PRESET, '-profile:v', 'main', '-pix_fmt', 'yuv420p',
+        '-b:v', str(rendition.video_bitrate),
+        '-maxrate', str(rendition_maxrate(rendition)),
+        '-bufsize', str(rendition_bufsize(rendition)),
+        # Keyframes alinhados entre renditions para trocas sem cortes
+        '-force_key_frames', f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})", '-sc_threshold', '0',
+    ]
+    if rendition.level:
+        # O nível fica fixo para bater certo com o CODECS do master.m3u8
+        args += ['-level', f"{rendition.level // 10}.{rendition.level % 10}"]
+    if threads:
+        args += ['-threads', str(threads)]
+    return args
+
+def audio_encode_args(rendition):
+    return ['-c:a', 'aac', '-b:a', str(rendition.audio_bitrate), '-ac', '2']
+
+def hls_output_args(output_dir):
+    """Saída HLS com segmentos fMP4 (CMAF) e playlist VOD."""
+    return [
+        '-f', 'hls',
+        '-hls_time', str(HLS_SEGMENT_SECONDS),
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_type', 'fmp4',
+        '-hls_fmp4_init_filename', 'init.mp4',
+        '-hls_segment_filename', os.path.join(output_dir, 'seg_%05d.m4s'),
+        os.path.join(output_dir, 'index.m3u8')
+    ]
+
+def thumbnail_time(video_info):
+    """Instante da thumbnail: 1s, ou metade da duração em vídeos curtos."""
+    duration = get_duration(video_info)
+    return min(1.0, duration / 2) if duration else 1.0
+
+def transcode_single_pass(filepath, output_dir, renditions, has_audio, thumbnail_path=None, thumbnail_at=1.0):
+    """
+    Gera todas as renditions (e a thumbnail) numa única invocação do ffmpeg.
+    
+    O input é lido e descodificado uma só vez; um filtro split entrega os
+    frames a um scale por rendition e, opcionalmente, a um ramo que extrai
+    a thumbnail. Cada rendition é uma saída HLS independente.
+    """
+    branches = len(renditions) + (1 if thumbnail_path else 0)
+    graph = [f"[0:v:0]split={branches}" + ''.join(f"[v{i}]" for i in range(branches))]
+    for i, rendition in enumerate(renditions):
+        graph.append(f"[v{i}]scale=-2:{rendition.height}[out{i}]")
+    if thumbnail_path:
+        graph.append(f"[v{len(renditions)}]trim=start={thumbnail_at:.3f},scale=320:240[thumb]")
+    
+    cmd = ['ffmpeg', '-v', 'error', '-y', '-i', filepath, '-filter_complex', ';'.join(graph)]
+    for i, rendition in enumerate(renditions):
+        rendition_dir = os.path.join(output_dir, rendition.name)
+        os.makedirs(rendition_dir, exist_ok=True)
+        cmd += ['-map', f"[out{i}]"] + video_encode_args(rendition, scale=False)
+        if has_audio:
+            cmd += ['-map', '0:a:0'] + audio_encode_args(rendition)
+        cmd += hls_output_args(rendition_dir)
+    if thumbnail_path:
+        cmd += ['-map', '[thumb]', '-vframes', '1', thumbnail_path]
+    
+    run_ffmpeg(cmd, "transcode em passagem única")
+
+def get_duration(video_info):
+    try:
+        return float(video_info['format']['duration'])
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+def chunk_seconds_for(duration, workers):
+    """
+    Duração alvo dos chunks: ~2 chunks por worker, múltiplo da duração
+    dos segmentos HLS e nunca abaixo de TRANSCODE_MIN_CHUNK_SECONDS.
+    """
+    target = max(TRANSCODE_MIN_CHUNK_SECONDS, duration / (workers * 2))
+    return int(math.ceil(target / HLS_SEGMENT_SECONDS) * HLS_SEGMENT_SECONDS)
+
+def should_transcode_in_chunks(video_info):
+    if not PARALLEL_TRANSCODE or TRANSCODE_WORKERS < 2:
+        return False
+    return get_duration(video_info) >= 2 * chunk_seconds_for(get_duration(video_info), TRANSCODE_WORKERS)
+
+def split_video_chunks(filepath, work_dir, chunk_seconds):
+    """
+    Corta o stream de vídeo em chunks sem recodificar.
+    
+    Com -c copy o segment muxer só corta em keyframes, por isso cada chunk
+    começa num keyframe e pode ser transcodificado de forma independente.
+    """
+    pattern = os.path.join(work_dir, 'chunk_%05d.mkv')
+    run_ffmpeg([
+        'ffmpeg', '-v', 'error', '-y', '-i', filepath,
+        '-map', '0:v:0', '-c', 'copy',
+        '-f', 'segment', '-segment_time', str(chunk_seconds), '-reset_timestamps', '1',
+        pattern
+    ], "split em chunks")
+    return sorted(
+        os.path.join(work_dir, name) for name in os.listdir(work_dir)
+        if name.startswith('chunk_') and name.endswith('.mkv')
+    )
+
+def concat_files(parts, output_path, work_dir, name):
+    """Concatena ficheiros com o concat demuxer (sem recodificar)."""
+    list_path = os.path.join(work_dir, f"{name}.txt")
+    with open(list_path, 'w') as f:
+        for part in parts:
+            f.write(f"file '{part}'\n")
+    run_ffmpeg([
+        'ffmpeg', '-v', 'error', '-y', '-f', 'concat', '-safe', '0', '-i', list_path,
+        '-c', 'copy', output_path
+    ], f"concat {name}")
+
+def verify_transcode(path, source_info, has_audio):
+    """
+    Verifica a paridade do resultado com o transcode serial: mesma duração
+    (dentro da tolerância) e mesmos streams (1 vídeo + áudio se existir).
+    """
+    info = get_video_info(path)
+    if not info:
+        raise Exception(f"Não foi possível verificar {os.path.basename(path)}")
+    
+    expected_streams = ['audio', 'video'] if has_audio else ['video']
+    streams = sorted(stream.get('codec_type') for stream in info.get('streams', []))
+    if streams != expected_streams:
+        raise Exception(f"Streams inesperados em {os.path.basename(path)}: {streams}")
+    
+    drift = abs(get_duration(info) - get_duration(source_info))
+    if drift > TRANSCODE_DURATION_TOLERANCE:
+        raise Exception(f"Duração de {os.path.basename(path)} difere {drift:.2f}s do original")
+
+def transcode_renditions_chunked(filepath, output_dir, renditions, video_info, has_audio):
+    """
+    Transcodifica todas as renditions em paralelo, por chunks.
+    
+    1. corta o vídeo em chunks em keyframes (stream copy)
+    2. transcodifica cada (rendition, chunk) e o áudio uma vez por bitrate
+       (partilhado pelas renditions com o mesmo) num pool com
+       TRANSCODE_WORKERS processos ffmpeg em simultâneo
+    3. concatena os chunks sem perdas, junta o áudio e segmenta em HLS
+    4. verifica duração e streams contra o original
+    """
+    work_dir = tempfile.mkdtemp(prefix='.work-', dir=HLS_FOLDER)
+    try:
+        chunk_seconds = chunk_seconds_for(get_duration(video_info), TRANSCODE_WORKERS)
+        chunks = split_video_chunks(filepath, work_dir, chunk_seconds)
+        logger.info(f"Vídeo dividido em {len(chunks)} chunks de ~{chunk_seconds}s "
+                    f"({TRANSCODE_WORKERS} workers)")
+        
+        def encode_chunk(rendition, index, chunk):
+            part = os.path.join(work_dir, f"{rendition.name}_{index:05d}.mp4")
+            # Um thread por ffmpeg: o paralelismo vem do número de processos
+            cmd = ['ffmpeg', '-v', 'error', '-y', '-i', chunk]
+            cmd += video_encode_args(rendition, threads=1) + ['-an', part]
+            run_ffmpeg(cmd, f"chunk {index} da rendition {rendition.name}")
+            return part
+        
+        def encode_audio(rendition):
+            audio_path = os.path.join(work_dir, f"audio_{rendition.audio_bitrate}.m4a")
+            cmd = ['ffmpeg', '-v', 'error', '-y', '-i', filepath, '-map', '0:a:0', '-vn']
+            cmd += audio_encode_args(rendition) + [audio_path]
+            run_ffmpeg(cmd, f"áudio a {rendition.audio_bitrate} bps")
+            return audio_path
+        
+        # As threads só esperam pelos processos ffmpeg, que fazem o trabalho
+        with ThreadPoolExecutor(max_workers=TRANSCODE_WORKERS) as pool:
+            part_futures = {
+                rendition.name: [pool.submit(encode_chunk, rendition, i, chunk) for i, chunk in enumerate(chunks)]
+                for rendition in renditions
+            }
+            # O áudio só depende do bitrate: uma codificação por bitrate distinto
+            audio_futures = {}
+            for rendition in renditions:
+                if has_audio and rendition.audio_bitrate not in audio_futures:
+                    audio_futures[rendition.audio_bitrate] = pool.submit(encode_audio, rendition)
+            parts = {name: [f.result() for f in futures] for name, futures in part_futures.items()}
+            audio = {bitrate: f.result() for bitrate, f in audio_futures.items()}
+        
+        for rendition in renditions:
+            video_path = os.path.join(work_dir, f"{rendition.name}_video.mp4")
+            concat_files(parts[rendition.name], video_path, work_dir, rendition.name)
+            
+            muxed_path = os.path.join(work_dir, f"{rendition.name}.mp4")
+            cmd = ['ffmpeg', '-v', 'error', '-y', '-i', video_path]
+            if has_audio:
+                cmd += ['-i', audio[rendition.audio_bitrate], '-map', '0:v:0', '-map', '1:a:0']
+            cmd += ['-c', 'copy', muxed_path]
+            run_ffmpeg(cmd, f"mux da rendition {rendition.name}")
+            
+            verify_transcode(muxed_path, video_info, has_audio)
+            
+            rendition_dir = os.path.join(output_dir, rendition.name)
+            os.makedirs(rendition_dir, exist_ok=True)
+            cmd = ['ffmpeg', '-v', 'error', '-y', '-i', muxed_path, '-c', 'copy']
+            run_ffmpeg(cmd + hls_output_args(rendition_dir), f"segmentação da rendition {rendition.name}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def write_master_playlist(output_dir, video_info, renditions, has_audio):
+    """Escreve o master.m3u8 de forma atómica (ficheiro temporário + rename)."""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:7', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for rendition in renditions:
+        bandwidth = rendition.video_bitrate + (rendition.audio_bitrate if has_audio else 0)
+        width = rendition_width(video_info, rendition.height)
+        lines.append(
+            f'#EXT-X-STREAM-INF:BANDWIDTH={int(bandwidth * 1.1)},AVERAGE-BANDWIDTH={bandwidth},'
+            f'RESOLUTION={width}x{rendition.height},CODECS="{rendition_codecs(rendition, has_audio)}"'
+        )
+        lines.append(f"{rendition.name}/index.m3u8")
+    
+    master_path = os.path.join(output_dir, 'master.m3u8')
+    tmp_path = os.path.join(output_dir, f".master.m3u8.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, master_path)
+    return master_path
+
+def create_renditions(filepath, output_dir, video_info, thumbnail_path=None):
+    """
+    Gera a escada ABR em HLS/CMAF para o vídeo (e a thumbnail, se pedida).
+    
+    O master.m3u8 só é escrito quando todas as renditions terminaram, por
+    isso o streaming service nunca expõe um conjunto incompleto.
+    
+    Returns:
+        (list, bool): nomes das renditions geradas e se a thumbnail foi criada
+    """
+    renditions = select_renditions(video_info)
+    if not renditions:
+        return [], False
+    
+    has_audio = get_stream(video_info, 'audio') is not None
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(HLS_FOLDER, exist_ok=True)
+    
+    transcode_start = time.time()
+    chunked = False
+    thumbnail_created = False
+    if should_transcode_in_chunks(video_info):
+        try:
+            transcode_renditions_chunked(filepath, output_dir, renditions, video_info, has_audio)
+            chunked = True
+            logger.info(f"Renditions geradas em paralelo em {time.time() - transcode_start:.2f}s")
+        except Exception as e:
+            # A passagem única é a referência: em caso de falha ou divergência, refazer
+            logger.warning(f"Transcode por chunks falhou, a usar modo serial: {e}")
+        if chunked and thumbnail_path:
+            thumbnail_created = create_thumbnail(filepath, thumbnail_path, thumbnail_time(video_info))
+    
+    if not chunked:
+        transcode_single_pass(
+            filepath, output_dir, renditions, has_audio,
+            thumbnail_path=thumbnail_path, thumbnail_at=thumbnail_time(video_info)
+        )
+        thumbnail_created = bool(thumbnail_path) and os.path.exists(thumbnail_path)
+        logger.info(f"Renditions geradas numa passagem em {time.time() - transcode_start:.2f}s")
+    
+    write_master_playlist(output_dir, video_info, renditions, has_audio)
+    return [rendition.name for rendition in renditions], thumbnail_created
+
+def write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+# ================================================================
+# CACHE POR CONTEÚDO
+# ================================================================
+
+def content_cache_dir(content_hash):
+    """Pasta de cache do conteúdo (None se o hash não for um SHA-256 válido)."""
+    if content_hash and re.match(r'^[0-9a-f]{64}$', content_hash):
+        return os.path.join(CACHE_FOLDER, content_hash)
+    return None
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+@contextmanager
+def cache_lock(directory):
+    """Lock exclusivo (flock) entre workers/containers que processam o mesmo conteúdo."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_master_renditions(output_dir):
+    """Renditions de um master.m3u8 já completo (None se não existir)."""
+    try:
+        with open(os.path.join(output_dir, 'master.m3u8')) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    return [line.split('/')[0] for line in lines if line and not line.startswith('#')]
+
+def link_hls_dir(video_id, target_dir):
+    """Aponta /videos/hls/<video_id> para as renditions em cache (symlink relativo)."""
+    os.makedirs(HLS_FOLDER, exist_ok=True)
+    link_path = os.path.join(HLS_FOLDER, str(video_id))
+    target = os.path.relpath(target_dir, HLS_FOLDER)
+    if os.path.islink(link_path) and os.readlink(link_path) == target:
+        return
+    
+    tmp_link = f"{link_path}.{os.getpid()}.lnk"
+    os.symlink(target, tmp_link)
+    if os.path.isdir(link_path) and not os.path.islink(link_path):
+        shutil.rmtree(link_path)
+    os.replace(tmp_link, link_path)
+
+# ================================================================
+# PIPELINE DE PROCESSAMENTO (GRAFO DE ESTÁGIOS)
+# ================================================================
+
+# required=True: a falha do estágio faz falhar o job e cancela os dependentes.
+# Estágios opcionais que falham entregam None aos dependentes.
+Stage = namedtuple('Stage', ['name', 'func', 'depends_on', 'required'])
+
+def run_stage(stage, outputs):
+    """Executa um estágio e mede o tempo, com ou sem erro."""
+    stage_start = time.time()
+    try:
+        return stage.func(outputs), None, time.time() - stage_start
+    except Exception as e:
+        return None, e, time.time() - stage_start
+
+def run_stage_graph(stages):
+    """
+    Executa o grafo: cada estágio arranca assim que as dependências
+    terminam, e estágios independentes correm em paralelo.
+    
+    Returns:
+        (outputs, timings, errors) por nome de estágio
+    """
+    pending = {stage.name: stage for stage in stages}
+    outputs, timings, errors = {}, {}, {}
+    failed_required = set()
+    running = {}
+    
+    with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(dep in failed_required for dep in stage.depends_on):
+                    del pending[name]
+                    errors[name] = "cancelado: dependência falhou"
+                    if stage.required:
+                        failed_required.add(name)
+                elif all(dep in outputs for dep in stage.depends_on):
+                    del pending[name]
+                    running[pool.submit(run_stage, stage, outputs)] = stage
+            
+            if not running:
+                break
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                output, error, elapsed = future.result()
+                timings[stage.name] = elapsed
+                outputs[stage.name] = output
+                if error is not None:
+                    errors[stage.name] = str(error)
+                    logger.warning(f"Estágio {stage.name} falhou: {error}")
+                    if stage.required:
+                        failed_required.add(stage.name)
+                        del outputs[stage.name]
+    
+    return outputs, timings, errors
+
 def process_video(video_data):
-    """Processa o vídeo - análise, thumbnail, validação, etc."""
+    """
+    Processa o vídeo como um grafo de estágios:
+    
+        probe -> {thumbnail, renditions} -> finalize
+    """
     filename = video_data.get('filename')
     filepath = video_data.get('filepath', os.path.join(VIDEO_FOLDER, filename))
+    video_id = video_data.get('id')
     
     logger.info(f"Iniciando processamento do vídeo: {filename}")
     
     start_time = time.time()
     processing_results = {
+        'id': video_id,
         'filename': filename,
         'success': False,
         'info': None,
         'thumbnail': False,
+        'thumbnail_path': None,
         'duration': 0,
+        'renditions': [],
+        'hls_url': None,
+        'cache_hits': [],
+        'stage_timings': {},
         'errors': []
     }
     
-    try:
-        # Verificar se o arquivo existe
-        if not os.path.exists(filepath):
-            raise Exception(f"Arquivo não encontrado: {filepath}")
+    # Com hash de conteúdo, probe/renditions ficam em cache
+    content_cache = content_cache_dir(video_data.get('content_hash'))
+    
+    def probe(outputs):
+        cache_path = os.path.join(content_cache, 'probe.json') if content_cache else None
+        video_info = read_json(cache_path) if cache_path else None
+        if video_info:
+            processing_results['cache_hits'].append('probe')
+        else:
+            video_info = get_video_info(filepath)
+            if video_info and cache_path:
+                write_json_atomic(cache_path, video_info)
         
-        # Obter informações do vídeo
-        video_info = get_video_info(filepath)
         if video_info:
             processing_results['info'] = video_info
-            
-            # Extrair duração
-            try:
-                duration = float(video_info['format']['duration'])
-                processing_results['duration'] = duration
-                logger.info(f"Duração do vídeo: {duration} segundos")
-            except:
-                pass
-        
-        # Criar thumbnail
-        thumbnail_path = os.path.join(VIDEO_FOLDER, f"thumb_{filename}.jpg")
-        if create_thumbnail(filepath, thumbnail_path):
+            processing_results['duration'] = get_duration(video_info)
+            logger.info(f"Duração do vídeo: {processing_results['duration']} segundos")
+        return video_info
+    
+    thumbnail_path = os.path.join(VIDEO_FOLDER, f"thumb_{filename}.jpg")
+    processing_results['thumbnail_path'] = thumbnail_path
+    
+    def encodes_renditions(video_info):
+        return video_id is not None and bool(select_renditions(video_info))
+    
+    def thumbnail(outputs):
+        # Com renditions, a thumbnail sai da mesma passagem do ffmpeg
+        if encodes_renditions(outputs['probe']):
+            return None
+        if content_cache and os.path.exists(thumbnail_path):
+            processing_results['cache_hits'].append('thumbnail')
+            processing_results['thumbnail'] = True
+        elif create_thumbnail(filepath, thumbnail_path, thumbnail_time(outputs['probe'])):
             processing_results['thumbnail'] = True
             logger.info(f"Thumbnail criada: thumb_{filename}.jpg")
-        
+        return processing_results['thumbnail']
+    
+    def cached_renditions(video_info):
+        """Renditions do conteúdo: reutiliza a cache ou gera-as sob lock."""
+        output_dir = os.path.join(content_cache, 'hls')
+        with cache_lock(content_cache):
+            created = read_master_renditions(output_dir)
+            if created is None:
+                created, thumbnail_created = create_renditions(filepath, output_dir, video_info, thumbnail_path)
+            else:
+                processing_results['cache_hits'].append('renditions')
+                thumbnail_created = os.path.exists(thumbnail_path) or create_thumbnail(
+                    filepath, thumbnail_path, thumbnail_time(video_info)
+                )
+        link_hls_dir(video_id, output_dir)
+        return created, thumbnail_created
+    
+    def renditions(outputs):
+        video_info = outputs['probe']
+        if not encodes_renditions(video_info):
+            return []
+        if content_cache:
+            created, thumbnail_created = cached_renditions(video_info)
+        else:
+            created, thumbnail_created = create_renditions(
+                filepath, os.path.join(HLS_FOLDER, str(video_id)), video_info, thumbnail_path
+            )
+        if thumbnail_created:
+            processing_results['thumbnail'] = True
+            logger.info(f"Thumbnail criada: thumb_{filename}.jpg")
+        if created:
+            processing_results['renditions'] = created
+            processing_results['hls_url'] = f"/hls/{video_id}/master.m3u8"
+            logger.info(f"Renditions HLS criadas: {', '.join(created)}")
+        return created
+    
+    def finalize(outputs):
         # Validar formato e qualidade
         file_size = os.path.getsize(filepath)
         logger.info(f"Tamanho do arquivo: {file_size / (1024*1024):.2f} MB")
+        return file_size
+    
+    try:
+        # Verificar se o arquivo existe
+        if not os.path.exists(filepath):
+            raise Exception(f"Arquivo não encontrado: {filepath}")
         
-        # Simular processamento adicional
-        time.sleep(2)
+        _, timings, errors = run_stage_graph([
+            Stage('probe', probe, (), False),
+            Stage('thumbnail', thumbnail, ('probe',), False),
+            Stage('renditions', renditions, ('probe',), True),
+            Stage('finalize', finalize, ('thumbnail', 'renditions'), True),
+        ])
+        processing_results['stage_timings'] = timings
+        processing_results['errors'].extend(f"{name}: {error}" for name, error in errors.items())
         
-        processing_results['success'] = True
-        logger.info(f"Vídeo processado com sucesso: {filename}")
+        if 'finalize' not in errors:
+            processing_results['success'] = True
+            logger.info(f"Vídeo processado com sucesso: {filename}")
         
     except Exception as e:
         error_msg = str(e)
         processing_results['errors'].append(error_msg)
         logger.error(f"Erro ao processar vídeo {filename}: {error_msg}")
-        VIDEOS_FAILED.inc()
     
     finally:
-        # Registrar tempo de processamento
+        # Tempo de processamento (as métricas são registadas no processo principal)
         processing_time = time.time() - start_time
-        PROCESSING_TIME.observe(processing_time)
-        
-        if processing_results['success']:
-            VIDEOS_PROCESSED.inc()
-        
+        processing_results['processing_time'] = processing_time
         logger.info(f"Processamento concluído em {processing_time:.2f} segundos")
     
     return processing_results
 
-def callback(ch, method, properties, body):
-    """Callback executado quando uma mensagem é recebida da fila."""
-    try:
-        video_data = json.loads(body)
-        logger.info(f"Recebido para processamento: {video_data.get('filename')}")
-        
-        # Atualizar métrica da fila
-        queue_info = ch.queue_declare(queue='video_processing', passive=True)
-        QUEUE_SIZE.set(queue_info.method.message_count)
-        
-        # Processar o vídeo
-        results = process_video(video_data)
-        
-        # Log dos resultados
-        if results['success']:
-            logger.info(f"✅ Processamento bem-sucedido: {results['filename']}")
-        else:
-            logger.error(f"❌ Falha no processamento: {results['filename']} - Erros: {results['errors']}")
-        
+def record_processing_metrics(results):
+    """Regista as métricas de um job (no processo principal, não no worker)."""
+    PROCESSING_TIME.observe(results.get('processing_time', 0))
+    for stage, elapsed in results.get('stage_timings', {}).items():
+        STAGE_TIME.labels(stage=stage).observe(elapsed)
+    for artifact in results.get('cache_hits', []):
+        CACHE_HITS.labels(artifact=artifact).inc()
+    if results['success']:
+        VIDEOS_PROCESSED.inc()
+        logger.info(f"✅ Processamento bem-sucedido: {results['filename']}")
+    else:
+        VIDEOS_FAILED.inc()
+        logger.error(f"❌ Falha no processamento: {results['filename']} - Erros: {results['errors']}")
+
+# ================================================================
+# CONSUMO CONCORRENTE
+# ================================================================
+
+worker_pool = None
+
+# Escrita em lote dos resultados na tabela videos (iniciada no main)
+results_writer = ResultsBatchWriter()
+
+def get_worker_pool(recreate=False):
+    """Pool de processos para os jobs (recriado se um worker morrer)."""
+    global worker_pool
+    if worker_pool is None or recreate:
+        if worker_pool is not None:
+            worker_pool.shutdown(wait=False)
+        # spawn: os workers não herdam as threads (Flask, métricas, pika) do pai
+        worker_pool = ProcessPoolExecutor(
+            max_workers=PROCESSOR_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return worker_pool
+
+def failed_results(video_data, error):
+    """Resultado de um job cujo worker não devolveu nada (crash ou exceção)."""
+    return {
+        'id': video_data.get('id'),
+        'filename': video_data.get('filename'),
+        'success': False,
+        'thumbnail': False,
+        'duration': 0,
+        'errors': [f"worker: {error}"]
+    }
+
+def on_job_done(channel, delivery_tag, results, lsn=None, outcome='ack'):
+    """
+    Executado na thread da conexão: confirma a mensagem ao RabbitMQ.
+    
+    outcome: 'ack' (resultado gravado), 'reject' (worker falhou, vídeo
+    gravado como failed) ou 'requeue' (não foi possível gravar o resultado).
+    """
+    if not channel.is_open:
+        logger.warning("Canal fechado antes do ack; a mensagem será reentregue")
+        return
+    
+    if outcome == 'requeue':
+        # Nada foi gravado: devolver a mensagem à fila para nova tentativa
+        channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        return
+    
+    if outcome == 'ack':
         # Confirmar que a mensagem foi processada
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-        
+        channel.basic_ack(delivery_tag=delivery_tag)
+    else:
+        # O worker falhou: rejeitar a mensagem e não reprocessar
+        channel.basic_nack(delivery_tag=delivery_tag, requeue=False)
+    
+    if results.get('id') is not None:
+        # Estado, duração e thumbnail mudaram: invalidar a cache do catálogo
+        channel.basic_publish(
+            exchange=CATALOG_EVENTS_EXCHANGE,
+            routing_key='',
+            body=json.dumps({"event": "video_processed", "video_ids": [results['id']], "lsn": lsn})
+        )
+
+def job_finished(connection, channel, delivery_tag, video_data, future):
+    """
+    Callback do future (thread interna do pool).
+    
+    O pika não é thread-safe, por isso o ack é agendado na thread da
+    conexão com add_callback_threadsafe.
+    """
+    ACTIVE_JOBS.dec()
+    outcome = 'ack'
+    try:
+        results = future.result()
+        record_processing_metrics(results)
     except Exception as e:
-        logger.error(f"Erro no callback: {e}")
-        # Rejeitar a mensagem e não reprocessar
-        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+        # Inclui BrokenProcessPool (worker morreu): sem resultado, o vídeo
+        # ficaria em 'processing' para sempre; grava-se como failed
+        logger.error(f"Worker falhou durante o processamento: {e!r}")
+        VIDEOS_FAILED.inc()
+        results = failed_results(video_data, e)
+        outcome = 'reject'
+    
+    def schedule(lsn=None, outcome=outcome):
+        try:
+            connection.add_callback_threadsafe(
+                functools.partial(on_job_done, channel, delivery_tag, results, lsn, outcome)
+            )
+        except Exception as e:
+            logger.warning(f"Conexão fechada antes do ack ({e}); a mensagem será reentregue")
+    
+    # Ack/nack só depois de o resultado estar gravado no catálogo
+    results_writer.submit(
+        results, on_written=schedule, on_error=functools.partial(schedule, outcome='requeue')
+    )
+
+def make_callback(connection):
+    """Callback de consumo: entrega cada mensagem ao pool e retorna logo."""
+    def callback(ch, method, properties, body):
+        try:
+            video_data = json.loads(body)
+            logger.info(f"Recebido para processamento: {video_data.get('filename')}")
+            
+            # Atualizar métrica da fila
+            queue_info = ch.queue_declare(queue='video_processing', passive=True)
+            QUEUE_SIZE.set(queue_info.method.message_count)
+            
+            try:
+                future = get_worker_pool().submit(process_video, video_data)
+            except BrokenProcessPool:
+                logger.warning("Pool de workers inválido, a recriar...")
+                future = get_worker_pool(recreate=True).submit(process_video, video_data)
+            
+            ACTIVE_JOBS.inc()
+            future.add_done_callback(
+                functools.partial(job_finished, connection, ch, method.delivery_tag, video_data)
+            )
+            
+        except Exception as e:
+            logger.error(f"Erro no callback: {e}")
+            # Rejeitar a mensagem e não reprocessar
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+    
+    return callback
 
 def main():
     """Função principal do processador de vídeos."""
@@ -227,20 +963,24 @@ def main():
     
     logger.info("Servidores de métricas e health check iniciados")
     
+    # Escrita dos resultados no catálogo em lotes
+    results_writer.start()
+    
     while True:
         try:
             connection, channel = connect_to_rabbitmq()
             
             if channel:
-                logger.info("🐰 Conectado ao RabbitMQ, aguardando mensagens...")
+                logger.info(f"🐰 Conectado ao RabbitMQ, aguardando mensagens ({PROCESSOR_WORKERS} workers)...")
                 
                 # Configura o consumo da fila
                 channel.basic_consume(
                     queue='video_processing', 
-                    on_message_callback=callback
+                    on_message_callback=make_callback(connection)
                 )
                 
-                # Inicia o consumo de mensagens
+                # Inicia o consumo de mensagens; os jobs correm no pool e esta
+                # thread continua a tratar heartbeats e acks
                 channel.start_consuming()
             else:
                 # Se falhar na conexão, aguarda e tenta novamente
@@ -251,6 +991,8 @@ def main():
             logger.info("🛑 Processador de vídeos interrompido")
             if 'connection' in locals() and connection and connection.is_open:
                 connection.close()
+            if worker_pool:
+                worker_pool.shutdown(wait=False, cancel_futures=True)
             break
         except Exception as e:
             logger.error(f"❌ Erro inesperado: {e}")